@@ -1,14 +1,16 @@
 import os
-import json
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+import argparse
 from dotenv import load_dotenv
 from logging_config import logger
 
-from read import validate_meta_details, process_tab_and_child_tabs
-from post import post_to_wp
-from write_url import write_url_to_sheet
+from read import validate_meta_details
+from memory_profile import get_memory_profiler
+from cpu_profile import cpu_profile
+from transport import install_transport
+from pipeline import (
+    load_common_settings, get_google_services, load_document, load_progress, load_cities,
+    source_pages, run_pipeline, process_document_tabs, log_summary
+)
 
 def load_configuration():
     """Load environment variables and handle missing configurations."""
@@ -30,9 +32,7 @@ def load_configuration():
             "page_title_format": os.getenv("page_title_format"),
             "key_phrase_format": os.getenv("key_phrase_format"),
             "description_format": os.getenv("description_format"),
-            "brand_name": os.getenv("BRAND_NAME"),
-            "google_credentials_file": "doc-reader.json",
-            "progress_file": "progress.json"
+            "brand_name": os.getenv("BRAND_NAME")
         }
 
         # Basic validation
@@ -41,6 +41,16 @@ def load_configuration():
             logger.error(f"❌ Missing required environment variables: {', '.join(missing_keys)}")
             exit(1)
 
+        # Optional settings
+        config.update(load_common_settings())
+        config.update({
+            "publish_mode": os.getenv("PUBLISH_MODE", "publish").strip().lower(),
+            "draft_workers": int(os.getenv("DRAFT_WORKERS", "4")),
+            "drafts_file": os.getenv("DRAFTS_FILE", "pending_drafts.json"),
+            "page_id_column": os.getenv("PAGE_ID_COLUMN", "").strip(),
+            "wp_timezone": os.getenv("WP_TIMEZONE", "").strip(),
+        })
+
         return config
 
     except Exception as e:
@@ -48,240 +58,83 @@ def load_configuration():
         exit(1)
 
 
-def get_google_services(credentials_file):
-    """Authenticate and return Google Docs and Sheets services."""
-    try:
-        SCOPES = [
-            "https://www.googleapis.com/auth/documents.readonly",
-            "https://www.googleapis.com/auth/spreadsheets"
-        ]
-        creds = service_account.Credentials.from_service_account_file(credentials_file, scopes=SCOPES)
-
-        doc_service = build("docs", "v1", credentials=creds)
-        sheet_service = build("sheets", "v4", credentials=creds)
-
-        return doc_service, sheet_service
-
-    except FileNotFoundError:
-        logger.error(f"❌ Credentials file not found: {credentials_file}")
-        exit(1)
-
-    except HttpError as e:
-        logger.error(f"❌ Google API HTTP error: {e}")
-        exit(1)
-
-    except Exception as e:
-        logger.exception(f"❌ Failed to authenticate Google services: {e}")
-        exit(1)
-
-
-def load_document(doc_service, doc_id):
-    """Load Google Document content safely."""
-    try:
-        doc = doc_service.documents().get(documentId=doc_id, includeTabsContent=True).execute()
-        logger.info(f"📄 Loaded document '{doc.get('title')}' successfully.")
-        return doc
-    except HttpError as e:
-        logger.error(f"❌ Google Docs API error: {e}")
-        exit(1)
-    except Exception as e:
-        logger.exception(f"❌ Failed to load document {doc_id}: {e}")
-        exit(1)
-
-
-def load_cities(sheet_service, spreadsheet_id, sheet_name):
-    """Retrieve list of cities from Google Sheet with fallback."""
-    try:
-        result = sheet_service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=f"{sheet_name}!A2:A"
-        ).execute()
-
-        cities = result.get("values", [])
-        flattened = [cell for row in cities for cell in row]
-        if not flattened:
-            raise ValueError("No cities found in the sheet.")
-        logger.info(f"📊 Retrieved {len(flattened)} cities from '{sheet_name}'.")
-        return flattened
-
-    except HttpError as e:
-        logger.error(f"❌ Google Sheets API error: {e}")
-        exit(1)
-    except Exception as e:
-        logger.exception(f"❌ Failed to load city list: {e}")
-        exit(1)
-
-PROGRESS_FILE = "progress.json"
-
-
-def load_progress(progress_file, doc_id):
-    """Load or initialize progress tracking file."""
-    try:
-        if os.path.exists(progress_file):
-            with open(progress_file, "r") as f:
-                progress = json.load(f)
-        else:
-            progress = {}
-
-        if doc_id not in progress:
-            progress[doc_id] = []
-        return progress
+def parse_args():
+    parser = argparse.ArgumentParser(description="Publish city pages from a Google Doc to WordPress.")
+    parser.add_argument("--watch", action="store_true", help="keep running and publish new or changed tabs as the doc changes")
+    parser.add_argument("--interval", type=int, default=300, help="seconds between revision polls in --watch mode")
+    parser.add_argument("--profile", action="store_true", help="record a cProfile of the whole run into profiles/")
+    parser.add_argument("--export-wxr", metavar="FILE", help="render every pending page into a WordPress WXR import file instead of posting")
+    parser.add_argument("--match-wxr", metavar="FILE", help="after importing FILE, write the imported page links into the sheet")
+    parser.add_argument("--plan", action="store_true", help="estimate requests, wall time and quota use for this run, then exit")
+    parser.add_argument("--targets", metavar="FILE", help="JSON list of WordPress sites to publish every rendered page to")
+    return parser.parse_args()
 
-    except json.JSONDecodeError:
-        logger.warning("⚠️ Corrupted progress.json — resetting progress.")
-        return {doc_id: []}
-    except Exception as e:
-        logger.exception(f"❌ Failed to load progress file: {e}")
-        return {doc_id: []}
 
+def main():
+    args = parse_args()
+    install_transport()
 
-def save_progress(progress_file, progress):
-    """Safely write progress updates to file."""
-    try:
-        with open(progress_file, "w") as f:
-            json.dump(progress, f, indent=4)
-    except Exception as e:
-        logger.exception(f"⚠️ Failed to save progress: {e}")
-
-
-def process_document_tabs(doc, config, sheet_service, cities, progress):
-    """Process all tabs and handle posting + sheet updates."""
-    tabs = doc.get("tabs", [])
-    total_tabs = len(tabs)
-    logger.info(f"📄 Document contains {total_tabs} tabs.")
-
-    counters = {
-        'processed_count': 0,
-        'skipped_count': 0,
-        'wrong_city_name_count': 0,
-        'wrong_internal_link_content_count': 0,
-        'empty_tab_count': 0,
-        'subtab_count': 0
-    }
-
-    for tab in tabs:
-        try:
-            html_content_dict = process_tab_and_child_tabs(
-                tab, progress, cities, config["valid_urls"], config["doc_id"], logger, counters
-            )
-
-            for city_name, html_content in html_content_dict.items():
-                try:
-                    page_title = config["page_title_format"].format(
-                        category_name=config["category_name"],
-                        city_name=city_name,
-                        brand_name=config["brand_name"]
-                    )
-                    key_phrase = config["key_phrase_format"].format(
-                        category_name=config["category_name"],
-                        city_name=city_name
-                    )
-                    description = config["description_format"].format(
-                        category_name=config["category_name"],
-                        city_name=city_name,
-                        country_name=config["country_name"]
-                    )
-
-                    response = post_to_wp(
-                        html_content,
-                        config["featured_img_url"],
-                        page_title,
-                        config["brand_name"],
-                        key_phrase,
-                        description,
-                        config["social_image"],
-                        config["wp_url"],
-                        config["wp_username"],
-                        config["wp_app_password"]
-                    )
-
-                    if not response:
-                        logger.warning(f"⚠️ No response for '{city_name}'. Skipping.")
-                        continue
-
-                    if response.status_code == 201:
-                        page_url = response.json().get("link", "")
-                        logger.info(f"✅ Created page for '{city_name}': {page_url}")
-
-                        write_url_to_sheet(
-                            sheet_service,
-                            config["spreadsheet_id"],
-                            config["sheet_name"],
-                            config["url_column"],
-                            page_url,
-                            city_name,
-                            cities,
-                            logger
-                        )
-
-                        progress[config["doc_id"]].append(city_name)
-                        counters["processed_count"] += 1
-                        save_progress(config["progress_file"], progress)
-
-                    else:
-                        logger.error(f"❌ Failed to post '{city_name}': {response.status_code} - {response.text}")
-
-                except Exception as e:
-                    logger.exception(f"⚠️ Error processing city '{city_name}': {e}")
-
-        except ValueError as ve:
-            # Catch link errors at tab level if missed in lower function
-            logger.warning(f"🚫 Skipping tab due to invalid internal link: {ve}")
-            counters["wrong_internal_link_content_count"] += 1
-            continue
-        
-        except Exception as e:
-            logger.exception(f"⚠️ Error processing tab: {e}")
-            continue
-
-    return counters, total_tabs
-
-
-def log_summary(counters, total_tabs, doc_id):
-    """Log summary after all processing."""
-    # Summary after processing document
-    logger.info(f"📊 =========================Summary for Document: {doc_id}================")
-    logger.info(f"📄 Total tabs: {total_tabs} ")
-    logger.info(f"✅ Processed new tabs: {counters['processed_count']}")
-    logger.info(f"📄 Subtabs processed (not counted as new): {counters['subtab_count']}")
-    logger.info(f"⏩ Skipped already processed: {counters['skipped_count']}")
-    if counters['wrong_city_name_count'] > 0:
-        logger.warning(f"⚠️ Tabs with wrong city names: {counters['wrong_city_name_count']}")
-    if counters['empty_tab_count'] > 0:
-        logger.warning(f"⚠️ Empty tabs skipped: {counters['empty_tab_count']}")
-    if counters['wrong_internal_link_content_count'] > 0:
-        logger.warning(f"⚠️ Tabs with wrong internal links: {counters['wrong_internal_link_content_count']}")
-
-
-    if (counters['processed_count'] - counters['subtab_count'] == total_tabs and counters['wrong_city_name_count'] == 0 and counters['wrong_internal_link_content_count'] == 0) or (counters['processed_count'] + counters['skipped_count'] == total_tabs and counters['wrong_city_name_count'] == 0 and counters['wrong_internal_link_content_count'] == 0 and counters['processed_count'] > 0 and counters['empty_tab_count'] == 0):
-        logger.info(f"✅ All the {total_tabs} tabs with {counters['subtab_count']} subtabs of the document {doc_id} processed successfully.")
-
-    elif counters['skipped_count'] == total_tabs:
-        logger.info(f"ℹ️ All tabs already processed for this document {doc_id}.")
-
-    else:
-        logger.warning(f"⚠️ Document {doc_id} processing completed with mixed results. Something wrong with processing this doc. Check manually.")
-
-    logger.info(f"*************************************************************************************************************")
-    logger.info(f"*************************************************************************************************************")
+    with cpu_profile(args.profile, "app", os.getenv("DOC_ID", "").strip()):
+        run(args)
 
 
-def main():
+def run(args):
     try:
         config = load_configuration()
+        profiler = get_memory_profiler(config["memory_profile"])
         doc_service, sheet_service = get_google_services(config["google_credentials_file"])
         doc = load_document(doc_service, config["doc_id"])
+        profiler.checkpoint("doc_fetch")
 
         # Validate Meta Details
         if not validate_meta_details(doc.get("title"), config["country_name"], config["category_name"]):
             logger.error("❌ Meta validation failed. Check country/category in .env or document name.")
             exit(1)
 
-        cities = load_cities(sheet_service, config["spreadsheet_id"], config["sheet_name"])
         progress = load_progress(config["progress_file"], config["doc_id"])
 
-        counters, total_tabs = process_document_tabs(doc, config, sheet_service, cities, progress)
-        log_summary(counters, total_tabs, config["doc_id"])
+        if args.watch:
+            from watch import run_watch
+            run_watch(config, doc_service, sheet_service, progress, args.interval, doc)
+            return
+
+        cities = load_cities(sheet_service, config["spreadsheet_id"], config["sheet_name"])
+
+        if args.plan:
+            from planner import plan_run
+            targets = ()
+            if args.targets:
+                from multi_target import load_targets, combined_progress
+                targets = load_targets(args.targets, config)
+                progress = combined_progress(targets, config["doc_id"])
+            tabs, _ = source_pages(doc, config, sheet_service, cities, progress)
+            plan_run("create", tabs, config, cities, progress, targets=targets)
+            return
+
+        if args.match_wxr:
+            from wxr_export import match_imported_links
+            match_imported_links(config, sheet_service, cities, progress, args.match_wxr)
+            return
+
+        if args.export_wxr:
+            from wxr_export import WxrSink
+            sink = WxrSink(config, args.export_wxr)
+            try:
+                tabs, render = source_pages(doc, config, sheet_service, cities, progress)
+                counters, total_tabs = run_pipeline(tabs, config, cities, progress, sink, profiler=profiler, render=render)
+            finally:
+                sink.close()
+            log_summary(counters, total_tabs, config["doc_id"], profiler)
+            return
+
+        if args.targets:
+            from multi_target import publish_to_targets
+            counters, total_tabs = publish_to_targets(doc, config, sheet_service, cities, args.targets, profiler)
+            log_summary(counters, total_tabs, config["doc_id"], profiler)
+            return
+
+        counters, total_tabs = process_document_tabs(doc, config, sheet_service, cities, progress, profiler=profiler)
+        log_summary(counters, total_tabs, config["doc_id"], profiler)
 
     except KeyboardInterrupt:
         logger.warning("⚠️ Process interrupted by user.")
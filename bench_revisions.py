@@ -0,0 +1,196 @@
+"""
+Revision benchmark for content_replacer updates against a local WordPress stand-in.
+
+Starts a stdlib HTTP server that answers the requests content_replacer makes
+(GET /wp-json/wp/v2/pages?slug=..., POST /wp-json/wp/v2/pages/<id>, POST /wp-json/loclite/v1/pages/bulk-upsert)
+on top of an SQLite wp_posts table. Like WordPress, every content update also stores a full copy of the page
+as a revision row, unless the request carries the plugin's revision flag (X-Loclite-Revisions header or
+"revisions" in the bulk body): "skip" stores none, N keeps only the newest N.
+
+Usage:
+    python bench_revisions.py                          # 200 pages x 5 refreshes, single-page updates
+    python bench_revisions.py --pages 1000 --rounds 10 --bulk
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from post import update_new_content, bulk_upsert_pages
+
+PARAGRAPH = "<p>" + "Trusted local carpenters for fitted wardrobes, kitchens and repairs. " * 12 + "</p>\n"
+
+
+class WordPressStandIn:
+    """wp_posts in SQLite plus the revision behaviour of wp_save_post_revision()."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE wp_posts (
+                ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                post_name TEXT, post_content TEXT, post_type TEXT, post_parent INTEGER, post_modified REAL
+            );
+            CREATE INDEX type_status_date ON wp_posts (post_type, post_name);
+            CREATE INDEX post_parent ON wp_posts (post_parent);
+        """)
+        self.lock = threading.Lock()
+
+    def add_page(self, slug, content):
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO wp_posts (post_name, post_content, post_type, post_parent, post_modified) VALUES (?, ?, 'page', 0, ?)",
+                (slug, content, time.time())
+            )
+
+    def find(self, slug):
+        row = self.db.execute("SELECT ID FROM wp_posts WHERE post_type = 'page' AND post_name = ?", (slug,)).fetchone()
+        return row[0] if row else None
+
+    def update(self, page_id, content, keep=None):
+        """keep=None stores every revision, 0 stores none, N trims to the newest N."""
+        with self.lock, self.db:
+            self.db.execute("UPDATE wp_posts SET post_content = ?, post_modified = ? WHERE ID = ?", (content, time.time(), page_id))
+            if keep == 0:
+                return
+            self.db.execute(
+                "INSERT INTO wp_posts (post_name, post_content, post_type, post_parent, post_modified) "
+                "SELECT ? , post_content, 'revision', ID, ? FROM wp_posts WHERE ID = ?",
+                (f"{page_id}-revision-v1", time.time(), page_id)
+            )
+            if keep:
+                self.db.execute(
+                    "DELETE FROM wp_posts WHERE ID IN (SELECT ID FROM wp_posts WHERE post_type = 'revision' AND post_parent = ? "
+                    "ORDER BY ID DESC LIMIT -1 OFFSET ?)",
+                    (page_id, keep)
+                )
+
+    def stats(self):
+        rows = dict(self.db.execute("SELECT post_type, COUNT(*) FROM wp_posts GROUP BY post_type").fetchall())
+        content_bytes = self.db.execute("SELECT COALESCE(SUM(LENGTH(post_content)), 0) FROM wp_posts").fetchone()[0]
+        return rows.get("page", 0), rows.get("revision", 0), content_bytes
+
+
+def parse_keep(mode):
+    if mode is None or mode == "":
+        return None
+    if mode == "skip":
+        return 0
+    if re.fullmatch(r"\d+", mode):
+        return int(mode)
+    raise ValueError(mode)
+
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            slug = parse_qs(url.query).get("slug", [""])[0]
+            page_id = site.find(slug)
+            self.reply(200, [{"id": page_id, "slug": slug}] if page_id else [])
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+            try:
+                if url.path.endswith("/pages/bulk-upsert"):
+                    keep = parse_keep(body.get("revisions"))
+                    results = []
+                    for item in body["items"]:
+                        page_id = site.find(item["slug"].strip("/"))
+                        if page_id is None:
+                            results.append({"slug": item["slug"], "id": None, "link": None, "status": "not_found"})
+                            continue
+                        site.update(page_id, item["content"], keep)
+                        results.append({"slug": item["slug"], "id": page_id, "link": f"http://wp.local/{item['slug']}/", "status": "updated"})
+                    return self.reply(200, results)
+
+                match = re.search(r"/wp/v2/pages/(\d+)$", url.path)
+                if match:
+                    site.update(int(match.group(1)), body["content"], parse_keep(self.headers.get("X-Loclite-Revisions")))
+                    return self.reply(200, {"id": int(match.group(1))})
+
+            except ValueError:
+                return self.reply(400, {"code": "invalid_revisions"})
+
+            self.reply(404, {"code": "rest_no_route"})
+
+    return Handler
+
+
+def run_scenario(mode, pages, rounds, bulk, chunk_size=25):
+    """Refresh every page `rounds` times with the given revision mode and return the timings and table size."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "wp.sqlite")
+        site = WordPressStandIn(db_path)
+        slugs = [f"carpenters-in-city-{i}" for i in range(pages)]
+        for slug in slugs:
+            site.add_page(slug, PARAGRAPH * 20)
+
+        server = HTTPServer(("127.0.0.1", 0), make_handler(site))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}/wp-json"
+
+        started = time.perf_counter()
+        for round_no in range(rounds):
+            content = PARAGRAPH * 20 + f"<p>Refresh {round_no}</p>"
+            if bulk:
+                for start in range(0, pages, chunk_size):
+                    items = [{"slug": slug, "content": content, "meta": {}, "create": False} for slug in slugs[start:start + chunk_size]]
+                    bulk_upsert_pages(items, f"{base}/loclite/v1/pages/bulk-upsert", "bench", "bench", mode)
+            else:
+                for slug in slugs:
+                    page_id = site.find(slug)
+                    update_new_content(slug, content, f"{base}/wp/v2/pages", page_id, "bench", "bench", "img.jpg", mode)
+        elapsed = time.perf_counter() - started
+
+        server.shutdown()
+        server.server_close()
+        page_rows, revision_rows, content_bytes = site.stats()
+        site.db.close()
+        db_bytes = os.path.getsize(db_path)
+
+    return {"elapsed": elapsed, "updates": pages * rounds, "pages": page_rows, "revisions": revision_rows,
+            "content_bytes": content_bytes, "db_bytes": db_bytes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure revision-free updates against a local WordPress stand-in.")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5, help="how many times every page is refreshed")
+    parser.add_argument("--bulk", action="store_true", help="use the bulk upsert route instead of one update per page")
+    parser.add_argument("--modes", default="default,skip,3", help="comma separated revision modes; 'default' sends no flag")
+    args = parser.parse_args()
+
+    print(f"🧪 {args.pages} pages x {args.rounds} refreshes via {'bulk upsert' if args.bulk else 'single-page updates'}")
+    print(f"{'mode':<10} {'total s':>9} {'ms/update':>10} {'wp_posts rows':>14} {'revisions':>10} {'db MB':>8}")
+
+    for mode in args.modes.split(","):
+        mode = mode.strip()
+        result = run_scenario(None if mode == "default" else mode, args.pages, args.rounds, args.bulk)
+        print(
+            f"{mode:<10} {result['elapsed']:>9.2f} {result['elapsed'] / result['updates'] * 1000:>10.2f} "
+            f"{result['pages'] + result['revisions']:>14} {result['revisions']:>10} {result['db_bytes'] / 1_048_576:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Startup benchmark: time from process start to the first Docs API response.
+
+Usage:
+    python bench_startup.py            # uses DOC_ID from .env
+    python bench_startup.py <doc_id>
+
+Run it twice: the second run reuses the cached access token in .cache/.
+"""
+import time
+
+START = time.perf_counter()
+
+import os
+import sys
+
+
+def main():
+    timings = {}
+
+    t0 = time.perf_counter()
+    from google_services import build_services
+    timings["import app modules"] = time.perf_counter() - t0
+
+    doc_id = sys.argv[1] if len(sys.argv) > 1 else os.getenv("DOC_ID")
+    if not doc_id:
+        print("❌ Pass a doc ID or set DOC_ID in .env")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    doc_service, _ = build_services("doc-reader.json")
+    timings["credentials + build services"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    doc = doc_service.documents().get(documentId=doc_id, fields="title").execute()
+    timings["first Docs request"] = time.perf_counter() - t0
+
+    timings["total to first Docs response"] = time.perf_counter() - START
+
+    print(f"📄 {doc.get('title')}")
+    for name, seconds in timings.items():
+        print(f"{name:<32} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
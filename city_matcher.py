@@ -0,0 +1,85 @@
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+CITY_MATCH_THRESHOLD = 0.75
+
+
+def normalize_city(name):
+    """'  Windsor & Maidenhead ' -> 'windsor and maidenhead' (accents, case, punctuation and spacing folded)."""
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    name = name.lower().replace("&", " and ")
+    return " ".join(re.findall(r"[a-z0-9]+", name))
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CityMatcher:
+    """
+    Resolve tab titles to sheet cities: exact name first, then normalized key, then the closest
+    name by trigram similarity (Dice coefficient) at or above the threshold.
+    The indexes are built once per run, so a lookup only touches cities that share a trigram with the title.
+    """
+
+    def __init__(self, cities, threshold=CITY_MATCH_THRESHOLD):
+        self.threshold = threshold
+        self.cities = set()
+        self.by_key = {}            # normalized key -> sheet city
+        self.ambiguous = set()      # keys shared by two different sheet cities; never auto-matched
+        self.gram_counts = {}       # normalized key -> number of trigrams
+        self.index = defaultdict(list)   # trigram -> normalized keys containing it
+
+        for city in cities:
+            city = city.strip()
+            if not city:
+                continue
+            self.cities.add(city)
+
+            key = normalize_city(city)
+            if key in self.by_key:
+                if self.by_key[key] != city:
+                    self.ambiguous.add(key)
+                continue
+
+            self.by_key[key] = city
+            grams = trigrams(key)
+            self.gram_counts[key] = len(grams)
+            for gram in grams:
+                self.index[gram].append(key)
+
+    def is_city(self, name):
+        return name in self.cities
+
+    def match(self, title):
+        """Return the sheet city for a tab title, or None when nothing is close enough or the match is ambiguous."""
+        title = title.strip()
+        if title in self.cities:
+            return title
+
+        key = normalize_city(title)
+        if not key:
+            return None
+
+        if key in self.by_key:
+            return None if key in self.ambiguous else self.by_key[key]
+
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.index.get(gram, ()))
+
+        scored = sorted(
+            ((2 * count / (len(grams) + self.gram_counts[candidate]), candidate) for candidate, count in shared.items()),
+            reverse=True
+        )
+        if not scored or scored[0][0] < self.threshold:
+            return None
+
+        best_score, best_key = scored[0]
+        if (len(scored) > 1 and scored[1][0] == best_score) or best_key in self.ambiguous:
+            return None
+
+        return self.by_key[best_key]
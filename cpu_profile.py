@@ -0,0 +1,85 @@
+import os
+import pstats
+import cProfile
+from datetime import datetime
+from contextlib import contextmanager
+from logging_config import logger
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+MAX_STACK_DEPTH = 64
+
+
+def frame_name(func):
+    """Render a pstats function key as 'file.py:function' for flamegraph frames."""
+    filename, _, name = func
+    if filename == "~":           # built-ins such as <method 'sub' of 're.Pattern' objects>
+        return name.replace(";", ",")
+    return f"{os.path.basename(filename)}:{name}".replace(";", ",")
+
+
+def write_collapsed_stacks(stats, path):
+    """
+    Write collapsed stacks ('a;b;c <microseconds>') for flamegraph.pl / speedscope.
+    cProfile only records caller->callee edges, so a function's time is split across its
+    call paths in proportion to the cumulative time each caller spent in it.
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    totals = {}
+
+    def walk(func, stack, fraction):
+        stack = stack + [func]
+        self_time = stats.stats[func][2] * fraction
+        if self_time >= 1e-6:
+            key = ";".join(frame_name(f) for f in stack)
+            totals[key] = totals.get(key, 0) + self_time
+
+        if len(stack) >= MAX_STACK_DEPTH:
+            return
+
+        for callee, edge_cumtime in callees.get(func, []):
+            callee_cumtime = stats.stats[callee][3]
+            if callee in stack or callee_cumtime <= 0:
+                continue
+            child_fraction = fraction * edge_cumtime / callee_cumtime
+            if child_fraction * callee_cumtime >= 1e-6:
+                walk(callee, stack, child_fraction)
+
+    roots = [func for func, (_, _, _, _, callers) in stats.stats.items() if not callers]
+    for root in roots:
+        walk(root, [], 1.0)
+
+    with open(path, "w", encoding="utf-8") as f:
+        for key, seconds in sorted(totals.items()):
+            micros = int(seconds * 1_000_000)
+            if micros > 0:
+                f.write(f"{key} {micros}\n")
+
+
+@contextmanager
+def cpu_profile(enabled, tag, doc_id):
+    """Profile the wrapped block with cProfile and write .pstats + .collapsed files when enabled."""
+    if not enabled:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            base = os.path.join(PROFILE_DIR, f"{tag}_{doc_id or 'nodoc'}_{timestamp}")
+
+            profiler.dump_stats(f"{base}.pstats")
+            write_collapsed_stacks(pstats.Stats(profiler), f"{base}.collapsed")
+
+            logger.info(f"🔥 CPU profile written to {base}.pstats and {base}.collapsed")
+        except Exception as e:
+            logger.error(f"❌ Failed to write CPU profile: {e}")
@@ -0,0 +1,192 @@
+import os
+import json
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from logging_config import logger
+
+SCOPES = [
+    "https://www.googleapis.com/auth/documents.readonly",
+    "https://www.googleapis.com/auth/spreadsheets"
+]
+
+TOKEN_CACHE_FILE = os.getenv("GOOGLE_TOKEN_CACHE", ".cache/google_token.json")
+GOOGLE_MAX_CONCURRENCY = int(os.getenv("GOOGLE_MAX_CONCURRENCY", "4"))
+
+_token_cache_file = TOKEN_CACHE_FILE
+
+
+def use_replay_token_cache():
+    """
+    Keep replayed tokens out of the real cache: a replayed OAuth response carries a redacted token,
+    which the next live run would otherwise load as valid. Called by transport.install_transport.
+    """
+    global _token_cache_file
+    root, ext = os.path.splitext(TOKEN_CACHE_FILE)
+    _token_cache_file = f"{root}.replay{ext}"
+
+
+def load_cached_token(creds, cache_file=None):
+    """Attach a still-valid cached access token to the credentials, if there is one."""
+    cache_file = cache_file or _token_cache_file
+    try:
+        if not os.path.exists(cache_file):
+            return False
+
+        with open(cache_file, "r") as f:
+            cached = json.load(f)
+
+        if cached.get("service_account_email") != creds.service_account_email:
+            return False
+
+        expiry = datetime.fromisoformat(cached["expiry"])
+        creds.token = cached["token"]
+        creds.expiry = expiry
+
+        # google-auth treats a token within its refresh window as expired, so this also guards clock skew
+        if not creds.valid:
+            creds.token = None
+            creds.expiry = None
+            return False
+
+        return True
+
+    except Exception as e:
+        logger.warning(f"⚠️ Ignoring unreadable token cache {cache_file}: {e}")
+        return False
+
+
+def save_cached_token(creds, cache_file=None):
+    """Persist the current access token so the next run can skip the OAuth round trip."""
+    cache_file = cache_file or _token_cache_file
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        fd = os.open(cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({
+                "service_account_email": creds.service_account_email,
+                "token": creds.token,
+                "expiry": creds.expiry.isoformat()
+            }, f)
+
+    except Exception as e:
+        logger.warning(f"⚠️ Could not save token cache {cache_file}: {e}")
+
+
+def load_credentials(credentials_file):
+    """Load service-account credentials, reusing a cached access token when still valid."""
+    # Heavy auth/crypto imports are deferred until credentials are actually needed
+    from google.oauth2 import service_account
+    from google.auth.transport.requests import Request
+
+    creds = service_account.Credentials.from_service_account_file(credentials_file, scopes=SCOPES)
+
+    if not load_cached_token(creds):
+        creds.refresh(Request())
+        save_cached_token(creds)
+
+    return creds
+
+
+def http_error():
+    """
+    googleapiclient's HttpError for `except http_error() as e:` clauses. An except expression is only
+    evaluated while an exception is being matched, so googleapiclient is not imported at startup.
+    """
+    from googleapiclient.errors import HttpError
+    return HttpError
+
+
+def build_services(credentials_file):
+    """Return (doc_service, sheet_service) for the calling thread from the shared client pool."""
+    return get_client_pool(credentials_file).services()
+
+
+class _SharedCredentials:
+    """Credentials proxy that lets many transports share one token and refresh it only once at a time."""
+
+    def __init__(self, creds):
+        self._creds = creds
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._creds, name)
+
+    def refresh(self, request):
+        with self._lock:
+            self._creds.refresh(request)
+            save_cached_token(self._creds)
+
+    def before_request(self, request, method, url, headers):
+        if not self._creds.valid:
+            with self._lock:
+                if not self._creds.valid:     # another worker may have refreshed while we waited
+                    self._creds.refresh(request)
+                    save_cached_token(self._creds)
+        self._creds.apply(headers)
+
+
+class _LimitedHttp:
+    """Transport wrapper that holds the pool's semaphore for every request, whichever thread makes it."""
+
+    def __init__(self, http, semaphore):
+        self._http = http
+        self._semaphore = semaphore
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)
+
+    def request(self, *args, **kwargs):
+        with self._semaphore:
+            return self._http.request(*args, **kwargs)
+
+
+class GoogleClientPool:
+    """
+    Per-thread Docs/Sheets clients over one shared credential.
+    httplib2 transports are not thread-safe, so every thread (the main thread included) gets its own
+    authorized transport, and a semaphore in the transport caps how many Google calls run at once.
+    """
+
+    def __init__(self, credentials_file, max_concurrency=GOOGLE_MAX_CONCURRENCY):
+        self.creds = _SharedCredentials(load_credentials(credentials_file))
+        self._local = threading.local()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def services(self):
+        """Return this thread's (doc_service, sheet_service), building them on first use."""
+        if not hasattr(self._local, "services"):
+            import httplib2
+            import google_auth_httplib2
+            from googleapiclient.discovery import build
+
+            http = _LimitedHttp(google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http(timeout=60)), self._semaphore)
+            self._local.services = (
+                build("docs", "v1", http=http, static_discovery=True, cache_discovery=False),
+                build("sheets", "v4", http=http, static_discovery=True, cache_discovery=False),
+            )
+        return self._local.services
+
+    @contextmanager
+    def docs(self):
+        yield self.services()[0]
+
+    @contextmanager
+    def sheets(self):
+        yield self.services()[1]
+
+
+_client_pool = None
+_client_pool_lock = threading.Lock()
+
+
+def get_client_pool(credentials_file="doc-reader.json"):
+    """Return the process-wide client pool, creating it on first use."""
+    global _client_pool
+    with _client_pool_lock:
+        if _client_pool is None:
+            _client_pool = GoogleClientPool(credentials_file)
+        return _client_pool
@@ -0,0 +1,75 @@
+import re
+from logging_config import logger
+
+# Every pass is render-neutral: browsers collapse whitespace, and bold inside bold is still bold.
+HEADING_RE = re.compile(r"^<h([1-6])><strong>(.*)</strong></h\1>$", re.M)
+NESTED_STRONG_RE = re.compile(r"</?strong>")
+ADJACENT_INLINE_RE = re.compile(r"</(strong|em)>(\s*)<\1>")
+EMPTY_INLINE_RE = re.compile(r"<(strong|em)>(\s*)</\1>")
+TAG_SPLIT_RE = re.compile(r"(<[^>]*>)")     # HTML -> [text, tag, text, ..., tag, text]
+LINK_OPEN_RE = re.compile(r'<a href="[^"]*">')
+SPACES_RE = re.compile(r"[ \t]{2,}")
+BLOCK_OPEN_SPACE_RE = re.compile(r"(<(?:p|li|h[1-6])>(?:<strong>)?) +")
+BLOCK_CLOSE_SPACE_RE = re.compile(r" +((?:</strong>)?</(?:p|li|h[1-6])>)")
+
+_optimizer_stats = {"pages": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def _flatten_heading(match):
+    level, inner = match.group(1), match.group(2)
+    return f"<h{level}><strong>{NESTED_STRONG_RE.sub('', inner)}</strong></h{level}>"
+
+
+def _text_node_passes(html_content):
+    """
+    Passes that must only see text nodes, never tags or attribute values: collapse runs of spaces, and join
+    <a href="x">one</a><a href="x">two</a> into one link. Links are only joined when they touch: any text between
+    them, even a space, would become link text.
+    """
+    parts = TAG_SPLIT_RE.split(html_content)
+    out = [SPACES_RE.sub(" ", parts[0])]
+
+    for i in range(1, len(parts), 2):
+        tag, text = parts[i], SPACES_RE.sub(" ", parts[i + 1])
+        # out ends with: <a href="x"> | link text | </a> | "" (no text node in between)
+        if LINK_OPEN_RE.fullmatch(tag) and len(out) >= 4 and out[-4] == tag and out[-2] == "</a>" and out[-1] == "":
+            out.pop()
+            out.pop()
+            out[-1] += text
+        else:
+            out += [tag, text]
+
+    return "".join(out)
+
+
+def optimize_html(html_content):
+    """Shrink rendered page HTML without changing how it renders, and count the bytes saved."""
+    optimized = HEADING_RE.sub(_flatten_heading, html_content)
+
+    # Merging can expose new neighbours (<strong><em>a</em></strong><strong><em>b</em></strong>), so repeat until stable
+    previous = None
+    while optimized != previous:
+        previous = optimized
+        optimized = EMPTY_INLINE_RE.sub(r"\2", optimized)
+        optimized = ADJACENT_INLINE_RE.sub(r"\2", optimized)
+        optimized = _text_node_passes(optimized)
+
+    optimized = BLOCK_OPEN_SPACE_RE.sub(r"\1", optimized)
+    optimized = BLOCK_CLOSE_SPACE_RE.sub(r"\1", optimized)
+
+    _optimizer_stats["pages"] += 1
+    _optimizer_stats["bytes_in"] += len(html_content.encode("utf-8"))
+    _optimizer_stats["bytes_out"] += len(optimized.encode("utf-8"))
+    return optimized
+
+
+def optimizer_stats():
+    return dict(_optimizer_stats)
+
+
+def log_optimizer_stats():
+    """Log the bytes saved by the optimizer in the run summary."""
+    stats = optimizer_stats()
+    if stats["pages"]:
+        saved = stats["bytes_in"] - stats["bytes_out"]
+        logger.info(f"🗜️ HTML optimizer: {stats['pages']} pages, {stats['bytes_in']:,} -> {stats['bytes_out']:,} bytes ({saved:,} saved, {saved / max(stats['bytes_in'], 1):.1%})")
@@ -0,0 +1,71 @@
+import tracemalloc
+from collections import Counter
+from logging_config import logger
+
+
+class MemoryProfiler:
+    """Take tracemalloc snapshots at pipeline stage boundaries and aggregate them per stage."""
+
+    def __init__(self, top_n=10):
+        self.top_n = top_n
+        self.stages = {}
+        tracemalloc.start()
+        self._last = self._snapshot()
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def checkpoint(self, stage):
+        """Record memory growth and peak since the previous checkpoint under the given stage name."""
+        snapshot = self._snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        stats = self.stages.setdefault(stage, {"count": 0, "peak": 0, "growth": 0, "sites": Counter()})
+        stats["count"] += 1
+        stats["peak"] = max(stats["peak"], peak)
+
+        diffs = snapshot.compare_to(self._last, "lineno")
+        stats["growth"] += sum(diff.size_diff for diff in diffs)
+        for diff in diffs[:self.top_n]:     # only the site list is capped
+            if diff.size_diff > 0:
+                stats["sites"][str(diff.traceback[0])] += diff.size_diff
+
+        self._last = snapshot
+
+    def report(self):
+        """Log peak memory and the top allocation sites for each stage."""
+        logger.info("🧠 Memory profile per stage:")
+        for stage, stats in self.stages.items():
+            logger.info(
+                f"🧠 {stage}: {stats['count']} checkpoints, peak {stats['peak'] / 1024 / 1024:.1f} MiB, "
+                f"net growth {stats['growth'] / 1024:.1f} KiB"
+            )
+            for site, size in stats["sites"].most_common(self.top_n):
+                logger.info(f"    {size / 1024:10.1f} KiB  {site}")
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off, so the hooks cost one no-op call."""
+
+    def checkpoint(self, stage):
+        pass
+
+    def report(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def get_memory_profiler(enabled):
+    """Return a live profiler when enabled, otherwise the shared no-op one."""
+    if not enabled:
+        return NULL_PROFILER
+    logger.info("🧠 Memory profiling enabled (tracemalloc).")
+    return MemoryProfiler()
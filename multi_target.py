@@ -0,0 +1,172 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from logging_config import logger
+
+from sinks import CreatePageSink
+from pipeline import (
+    load_progress, save_progress, source_pages, run_pipeline, get_page_registry,
+    get_pending_writes, retry_sheet_writes
+)
+from google_services import get_client_pool
+from resilience import CircuitBreaker, RateLimiter
+from write_url import SheetWriteQueue
+
+# Keys a target may override on top of the .env configuration
+TARGET_KEYS = (
+    "wp_url", "wp_username", "wp_app_password", "featured_img_url", "social_image",
+    "url_column", "country_name", "brand_name",
+    "page_title_format", "key_phrase_format", "description_format"
+)
+REQUIRED_TARGET_KEYS = ("name", "wp_url", "wp_username", "wp_app_password", "url_column")
+
+
+def load_targets(targets_file, config):
+    """
+    Read the targets file: a JSON list of WordPress sites that get the same rendered pages.
+    Each target is the .env configuration with its own overrides, progress file and rate limit.
+    """
+    try:
+        with open(targets_file, "r") as f:
+            entries = json.load(f)
+    except Exception as e:
+        logger.error(f"❌ Failed to read targets file {targets_file}: {e}")
+        exit(1)
+
+    if not isinstance(entries, list) or not entries:
+        logger.error(f"❌ Targets file {targets_file} must contain a non-empty JSON list.")
+        exit(1)
+
+    if config.get("publish_mode") == "draft":
+        # Targets publish through CreatePageSink; silently going live would defeat PUBLISH_MODE=draft
+        logger.error("❌ PUBLISH_MODE=draft is not supported with --targets. Unset it to publish to every target directly.")
+        exit(1)
+
+    targets = []
+    for entry in entries:
+        missing = [k for k in REQUIRED_TARGET_KEYS if not entry.get(k)]
+        if missing:
+            logger.error(f"❌ Target {entry.get('name', '?')} is missing: {', '.join(missing)}")
+            exit(1)
+
+        name = entry["name"]
+        target_config = dict(config)
+        target_config.update({k: entry[k] for k in TARGET_KEYS if entry.get(k)})
+        target_config["progress_file"] = entry.get("progress_file", f"progress_{name}.json")
+        target_config["page_id_column"] = entry.get("page_id_column", "")     # page IDs differ per site
+
+        targets.append({
+            "name": name,
+            "config": target_config,
+            "progress": load_progress(target_config["progress_file"], config["doc_id"]),
+            "breaker": CircuitBreaker(f"WordPress ({name})"),
+            "limiter": RateLimiter(entry.get("requests_per_minute", 0)),
+            "published": 0
+        })
+
+    logger.info(f"🌍 Publishing to {len(targets)} targets: {', '.join(t['name'] for t in targets)}")
+    return targets
+
+
+def combined_progress(targets, doc_id):
+    """Progress for the render pass: a tab is skipped only when every target already has it."""
+    done = set(targets[0]["progress"][doc_id])
+    for target in targets[1:]:
+        done &= set(target["progress"][doc_id])
+    return {doc_id: [city for city in targets[0]["progress"][doc_id] if city in done]}
+
+
+class MultiTargetSink:
+    """
+    Fan each rendered page out to every target that still needs it, one worker thread per target.
+    A city counts as done for the run once every target has it; each target records its own progress.
+    """
+
+    def __init__(self, targets, config, cities):
+        self.targets = targets
+        self.doc_id = config["doc_id"]
+        # Target threads must not share the main thread's Sheets client, so sheet writes always go through the pool
+        self.sheet_writer = SheetWriteQueue(
+            get_client_pool(config["google_credentials_file"]),
+            max(config["sheet_write_workers"], len(targets))
+        )
+        self.executor = ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="target")
+        # One registry for every target: entries are keyed by host + path
+        self.registry = get_page_registry(config)
+
+        for target in targets:
+            target["sink"] = CreatePageSink(
+                target["config"], None, cities, self.sheet_writer, target["breaker"], self.registry, get_pending_writes(config)
+            )
+
+    def _publish_to(self, target, city_name, html_content, counters):
+        target["limiter"].wait()
+        return target["sink"].publish(city_name, html_content, counters)
+
+    def _record(self, target, city_names):
+        """Record the cities a target sink reports as done (their sheet writes included) in its progress."""
+        new = [city for city in city_names if city not in target["progress"][self.doc_id]]
+        if new:
+            target["progress"][self.doc_id].extend(new)
+            target["published"] += len(new)
+            save_progress(target["config"]["progress_file"], target["progress"])
+
+    def _completed(self, city_names):
+        return [city for city in dict.fromkeys(city_names) if all(city in target["progress"][self.doc_id] for target in self.targets)]
+
+    def publish(self, city_name, html_content, counters):
+        futures = {
+            self.executor.submit(self._publish_to, target, city_name, html_content, counters): target
+            for target in self.targets
+            if city_name not in target["progress"][self.doc_id]
+        }
+
+        reported = [city_name]
+        for future, target in futures.items():
+            try:
+                done = future.result()
+            except Exception as e:
+                logger.exception(f"⚠️ Error publishing '{city_name}' to {target['name']}: {e}")
+                continue
+            self._record(target, done)
+            reported += done
+
+        return self._completed(reported)
+
+    def flush(self, counters):
+        reported = []
+        for target in self.targets:
+            done = target["sink"].flush(counters)
+            self._record(target, done)
+            reported += done
+        return self._completed(reported)
+
+    def in_flight(self):
+        return max(target["sink"].in_flight() for target in self.targets)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.sheet_writer.close()
+
+    def log_summary(self):
+        for target in self.targets:
+            logger.info(f"🌍 {target['name']}: published {target['published']} pages, {len(target['progress'][self.doc_id])} in total.")
+
+
+def publish_to_targets(doc, config, sheet_service, cities, targets_file, profiler):
+    """Render the document once and publish every page to all targets. Returns (counters, total_tabs)."""
+    targets = load_targets(targets_file, config)
+    retry_sheet_writes(config, sheet_service, cities)
+    sink = MultiTargetSink(targets, config, cities)
+
+    run_config = dict(config)
+    run_config["progress_file"] = None
+
+    try:
+        progress = combined_progress(targets, config["doc_id"])
+        tabs, render = source_pages(doc, config, sheet_service, cities, progress)
+        counters, total_tabs = run_pipeline(tabs, run_config, cities, progress, sink, profiler=profiler, render=render)
+    finally:
+        sink.close()
+
+    sink.log_summary()
+    return counters, total_tabs
@@ -0,0 +1,85 @@
+import os
+import json
+import threading
+from urllib.parse import urlparse
+from logging_config import logger
+
+
+def page_key(url):
+    """https://example.com/carpenters-in-leeds/ -> example.com/carpenters-in-leeds (same page on any scheme/slash)."""
+    parsed = urlparse(url.strip())
+    return f"{parsed.netloc.lower()}/{parsed.path.strip('/')}"
+
+
+class PageRegistry:
+    """
+    Local record of every page this tool created or looked up: {page key: {city, id, slug, link, modified}}.
+    content_replacer reads page IDs from here instead of resolving each URL with a slug query, and sends
+    'modified' back to the plugin so pages edited in WordPress since are not overwritten.
+    """
+
+    SAVE_EVERY = 25
+
+    def __init__(self, path):
+        self.path = path
+        self.pages = {}
+        self.lock = threading.Lock()
+        self.unsaved = 0
+
+        try:
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    self.pages = json.load(f)
+                logger.info(f"📒 Loaded {len(self.pages)} pages from the page registry {path}")
+        except Exception as e:
+            logger.warning(f"⚠️ Ignoring unreadable page registry {path}: {e}")
+
+    def lookup(self, url):
+        return self.pages.get(page_key(url))
+
+    def record(self, city_name, page):
+        """Store a WordPress page object (REST or bulk-route shape) for a city."""
+        if not page or not page.get("id") or not page.get("link"):
+            return
+        with self.lock:
+            self.pages[page_key(page["link"])] = {
+                "city": city_name,
+                "id": page["id"],
+                "slug": page.get("slug") or urlparse(page["link"]).path.strip("/").split("/")[-1],
+                "link": page["link"],
+                # GMT only: the plugin compares against modified_gmt, and "modified" is site-local time
+                "modified": page.get("modified_gmt") or None
+            }
+            self.unsaved += 1
+            if self.unsaved >= self.SAVE_EVERY:
+                self._save()
+
+    def touch(self, url, modified_gmt):
+        """Remember the page's new modified_gmt after this tool updated it (None when the response had none)."""
+        with self.lock:
+            entry = self.pages.get(page_key(url))
+            if entry:
+                entry["modified"] = modified_gmt or None    # a stale time would turn the next update into a false conflict
+                self.unsaved += 1
+
+    def forget(self, url):
+        """Drop a page whose recorded ID WordPress no longer knows (deleted, re-imported), so it is looked up again."""
+        with self.lock:
+            if self.pages.pop(page_key(url), None) is not None:
+                self.unsaved += 1
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        if not self.unsaved:
+            return
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.pages, f, indent=4)
+            os.replace(tmp_path, self.path)
+            self.unsaved = 0
+        except Exception as e:
+            logger.exception(f"⚠️ Failed to save page registry: {e}")
@@ -0,0 +1,368 @@
+"""
+Shared run engine for app.py and content_replacer.py.
+
+A run is source -> render -> sink:
+  source  the document tabs (optionally in priority order), or the sheet's cities in template mode (template.py)
+  render  process_tab_and_child_tabs, optionally pre-rendered in a process pool,
+          then html_optimizer.optimize_html
+  sink    what happens to each rendered page (see sinks.py: create or update)
+
+Progress, counters, run budget, memory checkpoints and the run summary live here,
+so every pooled client, cache and batching layer is shared by both entry points.
+"""
+import os
+import json
+from logging_config import logger
+
+from google_services import build_services, get_client_pool, http_error
+from write_url import SheetWriteQueue, PendingSheetWrites
+from page_registry import PageRegistry
+from read import process_tab_and_child_tabs, render_tabs_in_pool, log_render_cache_stats
+from scheduler import load_priorities, order_tabs
+from resilience import RunBudget
+from memory_profile import NULL_PROFILER
+from city_matcher import CityMatcher
+from html_optimizer import optimize_html, log_optimizer_stats
+from template import template_source
+from sinks import CreatePageSink, DraftPublishSink
+
+
+def load_common_settings():
+    """Optional settings shared by every entry point."""
+    return {
+        "google_credentials_file": "doc-reader.json",
+        "progress_file": os.getenv("PROGRESS_FILE", "progress.json"),
+        "render_processes": int(os.getenv("RENDER_PROCESSES", "0")),
+        "priority_column": os.getenv("PRIORITY_COLUMN", "").strip(),
+        "priority_cities": [c.strip() for c in os.getenv("PRIORITY_CITIES", "").split(",") if c.strip()],
+        "run_deadline_minutes": float(os.getenv("RUN_DEADLINE_MINUTES", "0")),
+        "max_pages_per_run": int(os.getenv("MAX_PAGES_PER_RUN", "0")),
+        "memory_profile": os.getenv("MEMORY_PROFILE", "").strip().lower() in ("1", "true", "yes"),
+        "sheet_write_workers": int(os.getenv("SHEET_WRITE_WORKERS", "0")),
+        "city_match_threshold": float(os.getenv("CITY_MATCH_THRESHOLD", "0")),
+        "html_optimize": os.getenv("HTML_OPTIMIZE", "false").strip().lower() in ("1", "true", "yes"),
+        "template_tab": os.getenv("TEMPLATE_TAB", "").strip(),
+        "template_sheet": os.getenv("TEMPLATE_SHEET", "").strip(),
+        "page_registry_file": os.getenv("PAGE_REGISTRY_FILE", "page_registry.json").strip(),
+        "conflict_check": os.getenv("CONFLICT_CHECK", "true").strip().lower() in ("1", "true", "yes"),
+        "sheet_retry_file": os.getenv("SHEET_RETRY_FILE", "pending_sheet_writes.json").strip(),
+    }
+
+
+def get_google_services(credentials_file):
+    """Authenticate and return Google Docs and Sheets services."""
+    try:
+        return build_services(credentials_file)
+
+    except FileNotFoundError:
+        logger.error(f"❌ Credentials file not found: {credentials_file}")
+        exit(1)
+
+    except http_error() as e:
+        logger.error(f"❌ Google API HTTP error: {e}")
+        exit(1)
+
+    except Exception as e:
+        logger.exception(f"❌ Failed to authenticate Google services: {e}")
+        exit(1)
+
+
+_sheet_writer = None
+
+
+def get_sheet_writer(config):
+    """Shared concurrent sheet writer, or None to keep writes inline (SHEET_WRITE_WORKERS=0)."""
+    global _sheet_writer
+    if config["sheet_write_workers"] < 1:
+        return None
+    if _sheet_writer is None:
+        _sheet_writer = SheetWriteQueue(get_client_pool(config["google_credentials_file"]), config["sheet_write_workers"])
+    return _sheet_writer
+
+
+_page_registry = None
+
+
+def get_page_registry(config):
+    """Shared page ID registry, or None when PAGE_REGISTRY_FILE is empty."""
+    global _page_registry
+    if not config["page_registry_file"]:
+        return None
+    if _page_registry is None:
+        _page_registry = PageRegistry(config["page_registry_file"])
+    return _page_registry
+
+
+_pending_writes = None
+
+
+def get_pending_writes(config):
+    """Shared store of failed link write-backs for created pages, or None when SHEET_RETRY_FILE is empty."""
+    global _pending_writes
+    if not config["sheet_retry_file"]:
+        return None
+    if _pending_writes is None:
+        _pending_writes = PendingSheetWrites(config["sheet_retry_file"])
+    return _pending_writes
+
+
+def retry_sheet_writes(config, sheet_service, cities):
+    """Write the links an earlier run could not write to the sheet."""
+    pending = get_pending_writes(config)
+    if pending is not None:
+        pending.retry(sheet_service, config["spreadsheet_id"], config["sheet_name"], cities, logger)
+
+
+def load_document(doc_service, doc_id):
+    """Load Google Document content safely."""
+    try:
+        doc = doc_service.documents().get(documentId=doc_id, includeTabsContent=True).execute()
+        logger.info(f"📄 Loaded document '{doc.get('title')}' successfully.")
+        return doc
+
+    except http_error() as e:
+        # Handle specific API permission errors
+        if e.resp.status == 403:
+            logger.error(
+                f"🚫 Permission denied for Google Doc ID '{doc_id}'. "
+                "Ensure the service account has access (shared or proper OAuth scope)."
+            )
+        elif e.resp.status == 404:
+            logger.error(
+                f"📄 Google Doc ID '{doc_id}' not found. Double-check the document ID or sharing settings."
+            )
+        else:
+            logger.error(f"❌ Google Docs API error: {e}")
+        exit(1)
+
+    except Exception as e:
+        logger.exception(f"❌ Failed to load document {doc_id}: {e}")
+        exit(1)
+
+
+def load_progress(progress_file, doc_id):
+    """Load or initialize progress tracking file."""
+    try:
+        if os.path.exists(progress_file):
+            with open(progress_file, "r") as f:
+                progress = json.load(f)
+        else:
+            progress = {}
+
+        if doc_id not in progress:
+            progress[doc_id] = []
+        return progress
+
+    except json.JSONDecodeError:
+        logger.warning("⚠️ Corrupted progress.json — resetting progress.")
+        return {doc_id: []}
+    except Exception as e:
+        logger.exception(f"❌ Failed to load progress file: {e}")
+        return {doc_id: []}
+
+
+def save_progress(progress_file, progress):
+    """Safely write progress updates to file."""
+    try:
+        with open(progress_file, "w") as f:
+            json.dump(progress, f, indent=4)
+    except Exception as e:
+        logger.exception(f"⚠️ Failed to save progress: {e}")
+
+
+def load_cities(sheet_service, spreadsheet_id, sheet_name):
+    """Retrieve list of cities from Google Sheet with fallback."""
+    try:
+        result = sheet_service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"{sheet_name}!A2:A"
+        ).execute()
+
+        cities = result.get("values", [])
+        flattened = [cell for row in cities for cell in row]
+        if not flattened:
+            raise ValueError("No cities found in the sheet.")
+        logger.info(f"📊 Retrieved {len(flattened)} cities from '{sheet_name}'.")
+        return flattened
+
+    except http_error() as e:
+        logger.error(f"❌ Google Sheets API error: {e}")
+        exit(1)
+    except Exception as e:
+        logger.exception(f"❌ Failed to load city list: {e}")
+        exit(1)
+
+
+def new_counters():
+    """Fresh per-run counters reported by log_summary."""
+    return {
+        'processed_count': 0,
+        'skipped_count': 0,
+        'wrong_city_name_count': 0,
+        'wrong_internal_link_content_count': 0,
+        'empty_tab_count': 0,
+        'subtab_count': 0,
+        'auto_matched': {},     # tab title -> sheet city resolved by the city matcher
+        'unpublishable': {}     # city -> reason, for tabs that fail until they are edited (empty, invalid link)
+    }
+
+
+def source_tabs(doc, config, sheet_service):
+    """Source stage: the document's top-level tabs, in priority order when configured."""
+    tabs = doc.get("tabs", [])
+
+    if config["priority_column"] or config["priority_cities"]:
+        priorities = {}
+        if config["priority_column"]:
+            priorities = load_priorities(sheet_service, config["spreadsheet_id"], config["sheet_name"], config["priority_column"])
+        tabs = order_tabs(tabs, priorities, config["priority_cities"])
+        if tabs:
+            logger.info(f"🔢 Publishing in priority order, starting with '{tabs[0]['tabProperties']['title'].strip()}'.")
+
+    return tabs
+
+
+def source_pages(doc, config, sheet_service, cities, progress):
+    """Return (items, render) for run_pipeline: document tabs with the default renderer, or cities + template renderer."""
+    if config["template_tab"]:
+        return template_source(doc, config, sheet_service, cities, progress)
+    return source_tabs(doc, config, sheet_service), None
+
+
+def commit_pages(city_names, config, progress, counters, budget):
+    """Record finished pages exactly once: progress entry, counter and budget."""
+    if not city_names:
+        return
+
+    for city_name in city_names:
+        progress[config["doc_id"]].append(city_name)
+        counters["processed_count"] += 1
+        budget.record_page()
+
+    if config["progress_file"]:     # multi-target runs keep their progress per target instead
+        save_progress(config["progress_file"], progress)
+
+
+def make_renderer(tabs, config, cities, progress):
+    """Default render stage: process_tab_and_child_tabs, pre-rendered in a process pool when configured."""
+    rendered = None
+    if config["render_processes"] > 1:
+        rendered = render_tabs_in_pool(
+            tabs, progress, cities, config["valid_urls"], config["doc_id"], config["render_processes"]
+        )
+
+    matcher = CityMatcher(cities, config["city_match_threshold"]) if config["city_match_threshold"] > 0 else None
+
+    def render(tab, counters):
+        return process_tab_and_child_tabs(
+            tab, progress, cities, config["valid_urls"], config["doc_id"], logger, counters, rendered, matcher
+        )
+
+    return render
+
+
+def run_pipeline(tabs, config, cities, progress, sink, stop_event=None, profiler=NULL_PROFILER, render=None):
+    """
+    Render every pending tab and hand each page to the sink. Returns (counters, total_tabs).
+    render(tab, counters) -> {city_name: html} replaces the per-tab renderer (template mode passes one item per city).
+    """
+    total_tabs = len(tabs)
+    logger.info(f"📄 Document contains {total_tabs} tabs.")
+
+    counters = new_counters()
+    budget = RunBudget(config["run_deadline_minutes"], config["max_pages_per_run"])
+
+    if render is None:
+        render = make_renderer(tabs, config, cities, progress)
+
+    for tab in tabs:
+        if stop_event is not None and stop_event.is_set():
+            logger.warning("🛑 Stop requested. Leaving remaining tabs for the next run.")
+            break
+
+        # Checked between tabs only: a tab marked done with unpublished child tabs would never be revisited
+        stop_reason = budget.exhausted(sink.in_flight() if hasattr(sink, "in_flight") else 0)
+        if stop_reason:
+            logger.warning(f"⏱️ {stop_reason.capitalize()} after {budget.pages} pages. Leaving remaining tabs for the next run.")
+            break
+
+        try:
+            html_content_dict = render(tab, counters)
+            profiler.checkpoint("tab_render")
+
+            for city_name, html_content in html_content_dict.items():
+                if config["html_optimize"]:
+                    html_content = optimize_html(html_content)
+
+                try:
+                    commit_pages(sink.publish(city_name, html_content, counters), config, progress, counters, budget)
+                except Exception as e:
+                    logger.exception(f"⚠️ Error processing city '{city_name}': {e}")
+
+                profiler.checkpoint("post")
+
+        except ValueError as ve:
+            # Catch link errors at tab level if missed in lower function
+            logger.warning(f"🚫 Skipping tab due to invalid internal link: {ve}")
+            counters["wrong_internal_link_content_count"] += 1
+            counters["unpublishable"][tab["tabProperties"]["title"].strip()] = "invalid internal link"
+            continue
+
+        except Exception as e:
+            logger.exception(f"⚠️ Error processing tab: {e}")
+            continue
+
+    commit_pages(sink.flush(counters), config, progress, counters, budget)
+    profiler.checkpoint("post")
+
+    return counters, total_tabs
+
+
+def process_document_tabs(doc, config, sheet_service, cities, progress, stop_event=None, profiler=NULL_PROFILER):
+    """Process all tabs and handle posting + sheet updates."""
+    retry_sheet_writes(config, sheet_service, cities)
+    tabs, render = source_pages(doc, config, sheet_service, cities, progress)
+    if config["publish_mode"] == "draft":
+        sink = DraftPublishSink(config, sheet_service, cities, get_sheet_writer(config), get_page_registry(config), get_pending_writes(config))
+    else:
+        sink = CreatePageSink(
+            config, sheet_service, cities, get_sheet_writer(config),
+            registry=get_page_registry(config), pending_writes=get_pending_writes(config)
+        )
+    return run_pipeline(tabs, config, cities, progress, sink, stop_event, profiler, render)
+
+
+def log_summary(counters, total_tabs, doc_id, profiler=NULL_PROFILER):
+    """Log summary after all processing."""
+    # Summary after processing document
+    logger.info(f"📊 =========================Summary for Document: {doc_id}================")
+    logger.info(f"📄 Total tabs: {total_tabs} ")
+    logger.info(f"✅ Processed new tabs: {counters['processed_count']}")
+    logger.info(f"📄 Subtabs processed (not counted as new): {counters['subtab_count']}")
+    logger.info(f"⏩ Skipped already processed: {counters['skipped_count']}")
+    if counters['wrong_city_name_count'] > 0:
+        logger.warning(f"⚠️ Tabs with wrong city names: {counters['wrong_city_name_count']}")
+    if counters['empty_tab_count'] > 0:
+        logger.warning(f"⚠️ Empty tabs skipped: {counters['empty_tab_count']}")
+    if counters['wrong_internal_link_content_count'] > 0:
+        logger.warning(f"⚠️ Tabs with wrong internal links: {counters['wrong_internal_link_content_count']}")
+    if counters['auto_matched']:
+        logger.info(f"🔗 Tab titles auto-matched to sheet cities: {len(counters['auto_matched'])} (fix these titles in the doc)")
+        for title, city_name in counters['auto_matched'].items():
+            logger.info(f"   '{title}' -> '{city_name}'")
+    log_render_cache_stats()
+    log_optimizer_stats()
+
+    if (counters['processed_count'] - counters['subtab_count'] == total_tabs and counters['wrong_city_name_count'] == 0 and counters['wrong_internal_link_content_count'] == 0) or (counters['processed_count'] + counters['skipped_count'] == total_tabs and counters['wrong_city_name_count'] == 0 and counters['wrong_internal_link_content_count'] == 0 and counters['processed_count'] > 0 and counters['empty_tab_count'] == 0):
+        logger.info(f"✅ All the {total_tabs} tabs with {counters['subtab_count']} subtabs of the document {doc_id} processed successfully.")
+
+    elif counters['skipped_count'] == total_tabs:
+        logger.info(f"ℹ️ All tabs already processed for this document {doc_id}.")
+
+    else:
+        logger.warning(f"⚠️ Document {doc_id} processing completed with mixed results. Something wrong with processing this doc. Check manually.")
+
+    profiler.report()
+
+    logger.info(f"*************************************************************************************************************")
+    logger.info(f"*************************************************************************************************************")
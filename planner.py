@@ -0,0 +1,291 @@
+import re
+import glob
+import logging
+import math
+import statistics
+import time
+from datetime import datetime
+from logging_config import logger, log_file_path
+
+from city_matcher import CityMatcher
+from pipeline import get_page_registry
+from google_services import GOOGLE_MAX_CONCURRENCY
+from read import read_tab
+
+LOG_LINE_RE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - \w+ - (.*)$")
+MAX_SAMPLE_SECONDS = 120        # longer gaps are idle time between runs, not request latency
+
+# Used when the logs have no history for an operation yet
+DEFAULT_SECONDS = {"create": 3.0, "update": 3.0, "sheet_write": 0.8}
+
+# Google's default per-user quotas (a service account is one user)
+SHEETS_WRITES_PER_MINUTE = 60
+DOCS_READS_PER_MINUTE = 300
+WP_BATCH_SIZE = 25
+RENDER_SAMPLE_TABS = 20
+
+
+def historical_latencies(log_pattern=None):
+    """
+    Seconds per create, update and sheet write, measured from the gaps between log lines of past runs:
+    'Reading ...' -> '✅ Created page' / '✅ Updated WP page ID' -> '✅ Link updated in the sheet'.
+    Older logs say "Reading X tab content..." and "✅ Page created successfully for X!".
+    """
+    log_pattern = log_pattern or f"{log_file_path}*"
+    samples = {"create": [], "update": [], "sheet_write": []}
+
+    for path in sorted(glob.glob(log_pattern)):
+        last_at, last_event = None, None
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                match = LOG_LINE_RE.match(line.rstrip("\n"))
+                if not match:
+                    continue
+                at = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S,%f")
+                message = match.group(2)
+
+                if message.startswith("Reading "):
+                    event = "read"
+                elif message.startswith(("✅ Created page", "✅ Page created successfully")):
+                    event = "create"
+                elif message.startswith("✅ Updated WP page ID"):
+                    event = "update"
+                elif message.startswith("✅ Link updated in the sheet"):
+                    event = "sheet_write"
+                elif message.startswith("✅ Logging initialized"):
+                    last_at, last_event = None, None
+                    continue
+                else:
+                    continue
+
+                if last_at is not None:
+                    gap = (at - last_at).total_seconds()
+                    valid = event in ("create", "update") or (event == "sheet_write" and last_event in ("create", "update"))
+                    if valid and 0 <= gap <= MAX_SAMPLE_SECONDS:
+                        samples[event].append(gap)
+
+                last_at, last_event = at, event
+
+    return samples
+
+
+def summarize(samples, operation):
+    """(median, p90, sample count) for an operation, falling back to the defaults without history."""
+    values = samples.get(operation) or []
+    if len(values) < 2:
+        default = values[0] if values else DEFAULT_SECONDS[operation]
+        return default, default, len(values)
+    return statistics.median(values), statistics.quantiles(values, n=10)[-1], len(values)
+
+
+def pending_pages(tabs, progress, doc_id, cities, matcher=None):
+    """Walk the tabs like process_tab_and_child_tabs and return (pages to publish, skipped, unknown cities)."""
+    pages, skipped, unknown = [], [], []
+
+    def walk(tab):
+        title = tab["tabProperties"]["title"].strip()
+        city_name = (matcher.match(title) if matcher is not None else None) or title
+
+        if city_name in progress[doc_id]:
+            skipped.append(city_name)
+            return
+        if city_name not in cities and not (matcher is not None and matcher.is_city(city_name)):
+            unknown.append(title)
+            return
+
+        pages.append(city_name)
+        for subtab in tab.get("childTabs", []):
+            walk(subtab)
+
+    for tab in tabs:
+        if isinstance(tab, str):    # template mode: the items are already sheet cities
+            (skipped if tab in progress[doc_id] else pages).append(tab)
+        else:
+            walk(tab)
+    return pages, skipped, unknown
+
+
+def sample_render_seconds(tabs, pages, valid_urls):
+    """Seconds to render one page, timed on up to RENDER_SAMPLE_TABS pending tabs (0 in template mode)."""
+    pending = set(pages)
+    bodies = []
+
+    def walk(tab):
+        if len(bodies) >= RENDER_SAMPLE_TABS:
+            return
+        content = tab.get("documentTab", {}).get("body", {}).get("content")
+        if tab["tabProperties"]["title"].strip() in pending and content is not None:
+            bodies.append(content)
+        for subtab in tab.get("childTabs", []):
+            walk(subtab)
+
+    for tab in tabs:
+        if not isinstance(tab, str):
+            walk(tab)
+    if not bodies:
+        return 0.0
+
+    started = time.perf_counter()
+    for content in bodies:
+        try:
+            read_tab(content, valid_urls)
+        except ValueError:
+            pass    # invalid internal link: the tab is skipped in the run, but its render time still counts
+    return (time.perf_counter() - started) / len(bodies)
+
+
+def plan_stages(mode, n, config, render_seconds, publish_seconds, write_seconds, targets=()):
+    """
+    Time per stage for n pages with the configured workers, and the wall time they add up to.
+    Returns ([{name, count, seconds, workers, total, setting}], wall seconds). Stages on the main thread run one
+    after another per page; stages on worker threads overlap with them.
+    """
+    def stage(name, count, seconds, workers, setting):
+        workers = max(workers, 1)
+        return {"name": name, "count": count, "seconds": seconds, "workers": workers, "total": count * seconds / workers, "setting": setting}
+
+    def google_workers(workers):
+        return min(workers, GOOGLE_MAX_CONCURRENCY) if GOOGLE_MAX_CONCURRENCY > 0 else workers
+
+    pooled = config["render_processes"] > 1
+    render = stage("render", n, render_seconds, config["render_processes"] if pooled else 1, f"RENDER_PROCESSES={config['render_processes']}")
+    upfront = render["total"] if pooled else 0      # the pool renders every tab before publishing starts
+    serial_render = 0 if pooled else render["total"]
+    sheet_workers = config["sheet_write_workers"]
+
+    if mode == "update" and config.get("update_engine") == "async" and not config.get("wp_bulk_url"):
+        workers = config["update_stage_workers"]
+        publish = stage("WordPress lookups + updates", n, publish_seconds, workers, f"UPDATE_STAGE_WORKERS={workers}")
+        sheet = stage("sheet writes", n, write_seconds, google_workers(workers), f"UPDATE_STAGE_WORKERS={workers}, GOOGLE_MAX_CONCURRENCY={GOOGLE_MAX_CONCURRENCY}")
+        # Pipelined: every stage runs at once, so the slowest one sets the pace
+        return [render, publish, sheet], upfront + max(serial_render, publish["total"], sheet["total"])
+
+    if sheet_workers > 0:
+        sheet = stage("sheet writes", n, write_seconds, google_workers(sheet_workers), f"SHEET_WRITE_WORKERS={sheet_workers}, GOOGLE_MAX_CONCURRENCY={GOOGLE_MAX_CONCURRENCY}")
+    else:
+        sheet = stage("sheet writes", n, write_seconds, 1, "SHEET_WRITE_WORKERS=0 (inline)")
+
+    if mode == "create" and config.get("publish_mode") == "draft" and not targets:
+        drafts = stage("draft creates", n, publish_seconds, config["draft_workers"], f"DRAFT_WORKERS={config['draft_workers']}")
+        batches = stage("batch publishes", math.ceil(n / WP_BATCH_SIZE), publish_seconds, 1, f"{WP_BATCH_SIZE} pages per /batch/v1 request")
+        # Phase 1 renders while the draft workers post; phase 2 publishes, then writes the links
+        phase1 = max(serial_render, drafts["total"])
+        phase2 = batches["total"] + sheet["total"]
+        return [render, drafts, batches, sheet], upfront + phase1 + phase2
+
+    if targets:
+        # Each page goes to every target at once; sheet writes always run on the queue, one per target
+        workers = max(sheet_workers, len(targets))
+        sheet = stage("sheet writes", n * len(targets), write_seconds, google_workers(workers), f"SHEET_WRITE_WORKERS={sheet_workers} (at least one per target), GOOGLE_MAX_CONCURRENCY={GOOGLE_MAX_CONCURRENCY}")
+        publish = stage(f"WordPress creates on {len(targets)} targets", n, publish_seconds, 1, "one page at a time, all targets in parallel")
+        limited = [t for t in targets if t["limiter"].interval]
+        if limited:
+            slowest = max(limited, key=lambda t: t["limiter"].interval)
+            floor = n * slowest["limiter"].interval
+            if floor > publish["total"]:
+                publish = stage(f"WordPress creates on {len(targets)} targets", n, slowest["limiter"].interval, 1, f"requests_per_minute of target {slowest['name']}")
+        stages = [render, publish, sheet]
+        return stages, upfront + max(serial_render + publish["total"], sheet["total"])
+
+    if mode == "create":
+        publish = stage("WordPress creates", n, publish_seconds, 1, "one page at a time (PUBLISH_MODE=draft creates in parallel)")
+    elif config.get("wp_bulk_url"):
+        publish = stage("WordPress bulk upserts", n, publish_seconds, 1, f"BULK_CHUNK_SIZE={config['bulk_chunk_size']}, per-page history is an upper bound")
+    else:
+        publish = stage("WordPress lookups + updates", n, publish_seconds, 1, "one page at a time (UPDATE_ENGINE=async runs them in parallel)")
+
+    main_thread = serial_render + publish["total"]
+    if sheet_workers > 0:
+        return [render, publish, sheet], upfront + max(main_thread, sheet["total"])
+    return [render, publish, sheet], upfront + main_thread + sheet["total"]
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s" if hours else f"{minutes}m {seconds:02d}s"
+
+
+def registry_hits(pages, city_urls, config):
+    """How many of the pages to update already have their page ID in the page registry (no slug lookup)."""
+    registry = get_page_registry(config)
+    if registry is None or not city_urls:
+        return 0
+    return sum(1 for city_name in pages if city_name in city_urls and registry.lookup(city_urls[city_name]))
+
+
+def plan_run(mode, tabs, config, cities, progress, city_urls=None, targets=()):
+    """
+    Report what a run would do without doing it: request counts per service, an estimated
+    wall time per stage from past logs and the configured workers, and how the run fits the Google per-minute quotas.
+    mode is "create" (app.py) or "update" (content_replacer.py, which passes its city -> URL map).
+    targets are the multi_target.load_targets entries of a --targets run.
+    """
+    matcher = CityMatcher(cities, config["city_match_threshold"]) if config["city_match_threshold"] > 0 else None
+    pages, skipped, unknown = pending_pages(tabs, progress, config["doc_id"], cities, matcher)
+    n = len(pages)
+
+    samples = historical_latencies()
+    publish_op = "create" if mode == "create" else "update"
+    publish_median, publish_p90, publish_samples = summarize(samples, publish_op)
+    write_median, write_p90, write_samples = summarize(samples, "sheet_write")
+    # The logged gaps start at 'Reading ...', so they include rendering: time it here and keep it apart
+    render_seconds = sample_render_seconds(tabs, pages, config["valid_urls"])
+
+    # WordPress requests per page for each path
+    if targets:
+        wp_requests = {f"creates ({len(targets)} targets)": n * len(targets)}
+    elif mode == "create" and config.get("publish_mode") == "draft":
+        wp_requests = {"draft creates": n, "batch publishes": math.ceil(n / WP_BATCH_SIZE)}
+    elif mode == "create":
+        wp_requests = {"creates": n}
+    elif config.get("wp_bulk_url"):
+        wp_requests = {"bulk upserts": math.ceil(n / config["bulk_chunk_size"])}
+    else:
+        wp_requests = {"slug lookups": n - registry_hits(pages, city_urls, config), "updates": n}
+
+    sheet_writes = n * max(len(targets), 1)
+    sheet_reads = 1 + (1 if config["priority_column"] else 0)
+
+    stages, estimate = plan_stages(mode, n, config, render_seconds, max(publish_median - render_seconds, 0), write_median, targets)
+    _, estimate_p90 = plan_stages(mode, n, config, render_seconds, max(publish_p90 - render_seconds, 0), write_p90, targets)
+    bottleneck = max(stages, key=lambda s: s["total"])
+    quota_floor = sheet_writes / SHEETS_WRITES_PER_MINUTE * 60
+
+    lines = [
+        f"🧭 Run plan for document {config['doc_id']} ({mode})",
+        f"   Pages to publish: {n}  |  already done: {len(skipped)}  |  not in sheet: {len(unknown)}",
+        "   WordPress requests: " + ", ".join(f"{count} {name}" for name, count in wp_requests.items()),
+        f"   Google requests: 1 Docs read, {sheet_reads} Sheets reads, {sheet_writes} Sheets writes",
+        f"   History: {publish_op} {publish_median:.2f}s median / {publish_p90:.2f}s p90 ({publish_samples} samples), "
+        f"sheet write {write_median:.2f}s median / {write_p90:.2f}s p90 ({write_samples} samples), "
+        f"render {render_seconds * 1000:.1f}ms per page (timed now)",
+        "   Stages (median):",
+        *(f"     {s['name']}: {s['count']} x {s['seconds']:.3f}s / {s['workers']} = {format_duration(s['total'])}  [{s['setting']}]" for s in stages),
+        f"   Bottleneck: {bottleneck['name']}, set by {bottleneck['setting']}",
+        f"   Estimated wall time: {format_duration(estimate)} (p90 {format_duration(estimate_p90)})",
+        f"   Sheets write quota ({SHEETS_WRITES_PER_MINUTE}/min per user): {sheet_writes} writes need at least {format_duration(quota_floor)}",
+    ]
+
+    if estimate and quota_floor > estimate:
+        lines.append("   ⚠️ The Sheets write quota is slower than the estimated run: expect 429s or lower SHEET_WRITE_WORKERS.")
+    if config["max_pages_per_run"] and n > config["max_pages_per_run"]:
+        lines.append(f"   ⏱️ MAX_PAGES_PER_RUN={config['max_pages_per_run']}: this needs {math.ceil(n / config['max_pages_per_run'])} runs.")
+    if config["run_deadline_minutes"] and estimate > config["run_deadline_minutes"] * 60:
+        lines.append(f"   ⏱️ RUN_DEADLINE_MINUTES={config['run_deadline_minutes']:g}: this needs about {math.ceil(estimate / (config['run_deadline_minutes'] * 60))} runs.")
+    if unknown:
+        lines.append(f"   ⚠️ Tabs that will be skipped as not in the sheet: {', '.join(unknown[:10])}{' ...' if len(unknown) > 10 else ''}")
+
+    # The log file only has a file handler; the plan is also shown on the console
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(console)
+    try:
+        for line in lines:
+            logger.info(line)
+    finally:
+        logger.removeHandler(console)
+
+    return {"pages": n, "skipped": len(skipped), "unknown": len(unknown), "wp_requests": wp_requests,
+            "sheet_writes": sheet_writes, "stages": stages, "bottleneck": bottleneck["name"],
+            "estimate_seconds": estimate, "estimate_p90_seconds": estimate_p90}
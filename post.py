@@ -1,48 +1,63 @@
 import requests
 from requests.auth import HTTPBasicAuth
-from bs4 import BeautifulSoup
 from logging_config import logger
+from resilience import wp_breaker
 
-def post_to_wp(html_content, featured_img_url, page_title, brand_name, key_phrase, description, social_image, WP_URL, USERNAME, APP_PASSWORD):
-    """Create a new WordPress post using REST API."""
-
-    try:
-                            
-        # Content to post (HTML)
-        soup = BeautifulSoup(html_content, "html.parser")
-        first_p = soup.find("p").get_text(" ", strip=True)
+def with_featured_image(html_content, featured_img_url):
+    """Prepend the featured image tag to the page HTML."""
+    return f'<img src="{featured_img_url}" alt="Featured Image" style="width:100%; height:auto;"/>\n' + html_content
 
-        # additional_description = first_p[:85]
 
-        additional_description = first_p[:100]
-        
-        last_space = additional_description.rfind(" ")  # Find the last space before the cutoff
+def build_page_data(html_content, featured_img_url, page_title, brand_name, key_phrase, description, social_image, status="publish"):
+    """Build the page payload (content + Yoast meta) shared by the REST create path and the WXR export."""
+    from bs4 import BeautifulSoup   # imported here so update-only runs never pay for bs4
 
-        if last_space != -1:
-            additional_description = additional_description[:last_space]
+    # Content to post (HTML)
+    soup = BeautifulSoup(html_content, "html.parser")
+    first_p = soup.find("p").get_text(" ", strip=True)
 
-        full_description = f"{description} {additional_description}"
+    # additional_description = first_p[:85]
 
-        # Prepend featured image to content
-        page_content = f'<img src="{featured_img_url}" alt="Featured Image" style="width:100%; height:auto;"/>\n' + html_content
-
-        page_data = {
-            "title": page_title,
-            "content": page_content,
-            "status": "publish",
-            # "featured_media": 9,  Id of the featured image in WordPress media library
-            "meta": {
-                "_yoast_wpseo_focuskw": f"{key_phrase}",
-                "_yoast_wpseo_title": f"{page_title} | {brand_name}",
-                "_yoast_wpseo_metadesc": f"{full_description}",
-                "_yoast_wpseo_opengraph-image": social_image,
-                "_yoast_wpseo_opengraph-title": f"{page_title} | {brand_name}",
-                "_yoast_wpseo_opengraph-description": f"{full_description}",
-                "_yoast_wpseo_twitter-image": social_image,
-                "_yoast_wpseo_twitter-title": f"{page_title} | {brand_name}",
-                "_yoast_wpseo_twitter-description": f"{full_description}"
-            }
+    additional_description = first_p[:100]
+    
+    last_space = additional_description.rfind(" ")  # Find the last space before the cutoff
+
+    if last_space != -1:
+        additional_description = additional_description[:last_space]
+
+    full_description = f"{description} {additional_description}"
+
+    # Prepend featured image to content
+    page_content = with_featured_image(html_content, featured_img_url)
+
+    return {
+        "title": page_title,
+        "content": page_content,
+        "status": status,
+        # "featured_media": 9,  Id of the featured image in WordPress media library
+        "meta": {
+            "_yoast_wpseo_focuskw": f"{key_phrase}",
+            "_yoast_wpseo_title": f"{page_title} | {brand_name}",
+            "_yoast_wpseo_metadesc": f"{full_description}",
+            "_yoast_wpseo_opengraph-image": social_image,
+            "_yoast_wpseo_opengraph-title": f"{page_title} | {brand_name}",
+            "_yoast_wpseo_opengraph-description": f"{full_description}",
+            "_yoast_wpseo_twitter-image": social_image,
+            "_yoast_wpseo_twitter-title": f"{page_title} | {brand_name}",
+            "_yoast_wpseo_twitter-description": f"{full_description}"
         }
+    }
+
+
+def post_to_wp(html_content, featured_img_url, page_title, brand_name, key_phrase, description, social_image, WP_URL, USERNAME, APP_PASSWORD, breaker=wp_breaker, status="publish"):
+    """Create a new WordPress post using REST API."""
+
+    if not breaker.allow():
+        logger.warning(f"⚡ WordPress circuit open. Not posting '{page_title}'.")
+        return None
+
+    try:
+        page_data = build_page_data(html_content, featured_img_url, page_title, brand_name, key_phrase, description, social_image, status)
 
         response = requests.post(
             WP_URL,
@@ -50,44 +65,164 @@ def post_to_wp(html_content, featured_img_url, page_title, brand_name, key_phras
             json=page_data,
             timeout=30
         )
+        breaker.record_status(response.status_code)
 
         return response
     
     except requests.exceptions.Timeout:
+        breaker.record_failure()
         logger.error(f"⏰ Timeout while posting '{page_title}' to WordPress.")
     except requests.exceptions.RequestException as re:
+        breaker.record_failure()
         logger.error(f"🌐 Request error during post_to_wp for '{page_title}': {re}")
     except Exception as e:
         logger.error(f"❌ Unexpected error in post_to_wp: {e}")
+    finally:
+        breaker.release()     # a probe that never reached WordPress must not hold the breaker half-open
 
     return None
 
 
-def update_new_content(city_name, html_content, WP_BASE, page_id, wp_username, wp_app_password, featured_img_url):
-    """Update an existing WordPress post with new HTML content."""
+def update_new_content(city_name, html_content, WP_BASE, page_id, wp_username, wp_app_password, featured_img_url, revisions=None, expected_modified=None):
+    """
+    Update an existing WordPress post with new HTML content.
+    revisions="skip" or N asks the plugin to skip or cap revisions; expected_modified (modified_gmt) makes
+    the plugin answer 409 instead of updating a page that was edited since.
+    """
+
+    if not wp_breaker.allow():
+        logger.warning(f"⚡ WordPress circuit open. Not updating '{city_name}'.")
+        return None
 
     try:
         if not page_id:
             raise ValueError("Missing page_id for update request.")
         
         # Prepend featured image to content
-        page_content = f'<img src="{featured_img_url}" alt="Featured Image" style="width:100%; height:auto;"/>\n' + html_content
+        page_content = with_featured_image(html_content, featured_img_url)
         
         endpoint = f"{WP_BASE}/{page_id}"
+        headers = {}
+        if revisions:
+            headers["X-Loclite-Revisions"] = str(revisions)
+        if expected_modified:
+            headers["X-Loclite-If-Modified-Gmt"] = expected_modified
+
         update_response = requests.post(
                             endpoint,
                             auth=HTTPBasicAuth(wp_username, wp_app_password),
                             json={"content": page_content},
+                            headers=headers or None,
                             timeout=30
                             )
+        wp_breaker.record_status(update_response.status_code)
 
         return update_response
 
     except requests.exceptions.Timeout:
+        wp_breaker.record_failure()
         logger.error(f"⏰ Timeout while updating '{city_name}' with page ID {page_id}.")
     except requests.exceptions.RequestException as re:
+        wp_breaker.record_failure()
         logger.error(f"🌐 Request error while updating '{city_name}' with page ID {page_id}: {re}")
     except Exception as e:
         logger.error(f"❌ Unexpected error in update_new_content: {e}")
+    finally:
+        wp_breaker.release()
+
+    return None
+
+
+def bulk_upsert_pages(items, bulk_url, wp_username, wp_app_password, revisions=None):
+    """Send a chunk of {slug, content, meta} items to the plugin's bulk upsert route."""
+
+    if not items:
+        return []
+
+    if not wp_breaker.allow():
+        logger.warning(f"⚡ WordPress circuit open. Not sending bulk upsert of {len(items)} pages.")
+        return None
+
+    try:
+        response = requests.post(
+                        bulk_url,
+                        auth=HTTPBasicAuth(wp_username, wp_app_password),
+                        json={"items": items, "revisions": str(revisions)} if revisions else {"items": items},
+                        timeout=30 + 2 * len(items)
+                        )
+        wp_breaker.record_status(response.status_code)
+        response.raise_for_status()
+
+        results = response.json()
+        if not isinstance(results, list) or len(results) != len(items):
+            raise ValueError("Invalid bulk upsert response format.")
+
+        return results
+
+    except requests.exceptions.Timeout:
+        wp_breaker.record_failure()
+        logger.error(f"⏰ Timeout while bulk upserting {len(items)} pages.")
+    except requests.exceptions.HTTPError as he:
+        logger.error(f"🌐 Bulk upsert of {len(items)} pages rejected: {he}")    # status already recorded above
+    except requests.exceptions.RequestException as re:
+        wp_breaker.record_failure()
+        logger.error(f"🌐 Request error during bulk upsert of {len(items)} pages: {re}")
+    except Exception as e:
+        logger.error(f"❌ Unexpected error in bulk_upsert_pages: {e}")
+    finally:
+        wp_breaker.release()
+
+    return None
+
+
+def wp_batch_url(wp_url):
+    """https://example.com/wp-json/wp/v2/pages -> https://example.com/wp-json/batch/v1"""
+    return wp_url.split("/wp/v2/")[0] + "/batch/v1"
+
+
+def publish_pages_batch(page_ids, batch_url, wp_username, wp_app_password):
+    """Flip up to 25 draft pages to published in one request through the core /batch/v1 endpoint."""
+
+    if not page_ids:
+        return []
+
+    if not wp_breaker.allow():
+        logger.warning(f"⚡ WordPress circuit open. Not publishing batch of {len(page_ids)} drafts.")
+        return None
+
+    try:
+        response = requests.post(
+                        batch_url,
+                        auth=HTTPBasicAuth(wp_username, wp_app_password),
+                        json={
+                            "validation": "normal",
+                            "requests": [
+                                {"method": "POST", "path": f"/wp/v2/pages/{page_id}", "body": {"status": "publish"}}
+                                for page_id in page_ids
+                            ]
+                        },
+                        timeout=30 + 2 * len(page_ids)
+                        )
+        wp_breaker.record_status(response.status_code)
+        response.raise_for_status()
+
+        responses = response.json().get("responses")
+        if not isinstance(responses, list) or len(responses) != len(page_ids):
+            raise ValueError("Invalid batch response format.")
+
+        return responses
+
+    except requests.exceptions.Timeout:
+        wp_breaker.record_failure()
+        logger.error(f"⏰ Timeout while publishing batch of {len(page_ids)} drafts.")
+    except requests.exceptions.HTTPError as he:
+        logger.error(f"🌐 Batch publish of {len(page_ids)} drafts rejected: {he}")    # status already recorded above
+    except requests.exceptions.RequestException as re:
+        wp_breaker.record_failure()
+        logger.error(f"🌐 Request error during batch publish of {len(page_ids)} drafts: {re}")
+    except Exception as e:
+        logger.error(f"❌ Unexpected error in publish_pages_batch: {e}")
+    finally:
+        wp_breaker.release()
 
     return None
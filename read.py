@@ -1,6 +1,16 @@
+import os
 import re
+import json
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from logging_config import logger
 
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "4096"))   # 0 disables the paragraph cache
+
+_render_cache = OrderedDict()
+_render_cache_stats = {"hits": 0, "misses": 0}
+
 def validate_meta_details(doc_title, country_name, category_name):
     """Check if both country and category names exist in the document title."""
     try:   
@@ -105,6 +115,93 @@ def text_to_html(paragraph, valid_urls, is_heading=False):
         logger.error(f"❌ Unexpected error in text_to_html: {e}")
         raise
 
+def render_paragraph(paragraph, valid_urls):
+    """Render one paragraph into its HTML line, or None if it has no text."""
+    style = paragraph.get("paragraphStyle", {}).get("namedStyleType", "")
+    is_heading = style.startswith("HEADING_")
+
+    text = text_to_html(paragraph, valid_urls, is_heading)
+
+    if not text:
+        return None
+
+    text = remove_emojis_and_symbols(text)
+
+    # Headings
+    if is_heading:
+        level = int(style.split("_")[1])
+        return f"<h{level}><strong>{text}</strong></h{level}>"
+
+    # Bullets / Numbered Lists
+    if "bullet" in paragraph:
+        return f"<li>{text}</li>"
+
+    # Normal paragraph
+    return f"<p>{text}</p>"
+
+
+def paragraph_cache_key(paragraph):
+    """Hash only what affects the rendered HTML: text runs with their styles, heading style and bullet flag."""
+    runs = [
+        [element["textRun"].get("content", ""), element["textRun"].get("textStyle", {})]
+        for element in paragraph.get("elements", []) if "textRun" in element
+    ]
+    payload = json.dumps(
+        [paragraph.get("paragraphStyle", {}).get("namedStyleType", ""), "bullet" in paragraph, runs],
+        sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).digest()
+
+
+def paragraph_links(paragraph):
+    """Return the normalised link URLs of a paragraph in element order."""
+    return [
+        fix_url(element["textRun"]["textStyle"]["link"]["url"])
+        for element in paragraph.get("elements", [])
+        if element.get("textRun", {}).get("textStyle", {}).get("link", {}).get("url")
+    ]
+
+
+def render_paragraph_cached(paragraph, valid_urls):
+    """render_paragraph behind a bounded LRU cache. Cached links are re-validated on every hit."""
+    if RENDER_CACHE_SIZE <= 0:
+        return render_paragraph(paragraph, valid_urls)
+
+    key = paragraph_cache_key(paragraph)
+    cached = _render_cache.get(key)
+
+    if cached is not None:
+        _render_cache.move_to_end(key)
+        _render_cache_stats["hits"] += 1
+        line, links = cached
+        for url in links:
+            if url not in valid_urls:
+                raise ValueError(f'{url}')
+        return line
+
+    _render_cache_stats["misses"] += 1
+    line = render_paragraph(paragraph, valid_urls)      # raises before caching if a link is invalid
+
+    _render_cache[key] = (line, paragraph_links(paragraph))
+    if len(_render_cache) > RENDER_CACHE_SIZE:
+        _render_cache.popitem(last=False)
+
+    return line
+
+
+def render_cache_stats():
+    """Return paragraph cache hit/miss counts for the run report."""
+    return {**_render_cache_stats, "size": len(_render_cache)}
+
+
+def log_render_cache_stats():
+    """Log the paragraph cache hit rate in the run summary."""
+    stats = render_cache_stats()
+    lookups = stats["hits"] + stats["misses"]
+    if lookups:
+        logger.info(f"♻️ Paragraph render cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hits'] / lookups:.0%} hit rate)")
+
+
 def read_tab(tab_content, valid_urls):
     """Convert all paragraphs in a tab into clean HTML."""
     html_lines = []
@@ -114,32 +211,10 @@ def read_tab(tab_content, valid_urls):
             if "paragraph" not in content:
                 continue
 
-            paragraph = content["paragraph"]
-            # text = text_to_html(paragraph, valid_urls)
-            style = paragraph.get("paragraphStyle", {}).get("namedStyleType", "")
-            is_heading = style.startswith("HEADING_")
-
-            text = text_to_html(paragraph, valid_urls, is_heading)
-
-            if not text:
-                continue
-
-            text = remove_emojis_and_symbols(text)
+            line = render_paragraph_cached(content["paragraph"], valid_urls)
 
-            # Headings
-            style = paragraph.get("paragraphStyle", {}).get("namedStyleType", "")
-            if style.startswith("HEADING_"):
-                level = int(style.split("_")[1])
-                html_lines.append(f"<h{level}><strong>{text}</strong></h{level}>")
-                continue
-
-            # Bullets / Numbered Lists
-            if "bullet" in paragraph:
-                html_lines.append(f"<li>{text}</li>")
-                continue
-
-            # Normal paragraph
-            html_lines.append(f"<p>{text}</p>")
+            if line is not None:
+                html_lines.append(line)
 
         # Combine list items into <ul> tags
         html_output = []
@@ -163,18 +238,84 @@ def read_tab(tab_content, valid_urls):
         raise
 
 
-def process_tab_and_child_tabs(tab, progress, flat_cities_list, valid_urls, doc_id, logger, counter):
+_worker_valid_urls = None
+
+
+def _init_render_worker(valid_urls):
+    """Store the valid URL list once per worker process instead of once per job."""
+    global _worker_valid_urls
+    _worker_valid_urls = valid_urls
+
+
+def _render_tab_worker(job):
+    """Render one tab's body in a worker process. Errors are returned, not raised."""
+    tab_id, content_json = job
+    hits, misses = _render_cache_stats["hits"], _render_cache_stats["misses"]
+    try:
+        html, error = read_tab(json.loads(content_json), _worker_valid_urls), None
+    except Exception as e:
+        html, error = None, e
+    # Send the cache counter deltas back so the parent's run report covers worker caches too
+    return tab_id, html, error, _render_cache_stats["hits"] - hits, _render_cache_stats["misses"] - misses
+
+
+def _collect_render_jobs(tab, progress, flat_cities_list, doc_id, jobs):
+    """Collect (tab_id, body JSON) for every tab the serial walk would render."""
+    city_name = tab["tabProperties"]["title"].strip()
+    if city_name in progress[doc_id] or city_name not in flat_cities_list:
+        return
+
+    tab_id = tab["tabProperties"].get("tabId")
+    tab_content = tab.get("documentTab", {}).get("body", {}).get("content")
+    if tab_id and tab_content is not None:
+        # A JSON string pickles as one flat buffer, far cheaper than the nested dicts.
+        jobs.append((tab_id, json.dumps(tab_content, separators=(",", ":"))))
+
+    for subtab in tab.get("childTabs") or []:
+        _collect_render_jobs(subtab, progress, flat_cities_list, doc_id, jobs)
+
+
+def render_tabs_in_pool(tabs, progress, flat_cities_list, valid_urls, doc_id, processes):
+    """Render all pending tabs across a process pool. Returns {tab_id: (html, error)}."""
+    jobs = []
+    for tab in tabs:
+        _collect_render_jobs(tab, progress, flat_cities_list, doc_id, jobs)
+
+    if not jobs:
+        return {}
+
+    logger.info(f"⚙️ Rendering {len(jobs)} tabs across {processes} processes...")
+    chunksize = max(1, len(jobs) // (processes * 4))
+
+    rendered = {}
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_render_worker, initargs=(valid_urls,)) as pool:
+        for tab_id, html, error, hits, misses in pool.map(_render_tab_worker, jobs, chunksize=chunksize):
+            rendered[tab_id] = (html, error)
+            _render_cache_stats["hits"] += hits
+            _render_cache_stats["misses"] += misses
+
+    return rendered
+
+
+def process_tab_and_child_tabs(tab, progress, flat_cities_list, valid_urls, doc_id, logger, counter, rendered=None, matcher=None):
    
     global skipped_count, wrong_city_name_count, empty_tab_count, wrong_internal_link_content_count
 
     city_name = tab["tabProperties"]["title"].strip()
+
+    if matcher is not None:     # resolve near-miss titles ("Windsor & Maidenhead") to the sheet's spelling
+        matched = matcher.match(city_name)
+        if matched and matched != city_name:
+            logger.info(f"🔗 Auto-matched tab '{city_name}' to sheet city '{matched}'")
+            counter['auto_matched'][city_name] = matched
+            city_name = matched
         
     if city_name in progress[doc_id]:
         logger.info(f"⏩ Skipping already processed tab: '{city_name}'")
         counter['skipped_count'] += 1
         return {}
 
-    if city_name not in flat_cities_list:
+    if city_name not in flat_cities_list and not (matcher is not None and matcher.is_city(city_name)):
         logger.info(f"⚠️ City '{city_name}' not found in sheet. Skipping tab.")
         counter['wrong_city_name_count'] += 1
         return {}
@@ -183,7 +324,13 @@ def process_tab_and_child_tabs(tab, progress, flat_cities_list, valid_urls, doc_
         logger.info(f"Reading '{city_name}' tab content...")
         tab_content = tab["documentTab"]["body"]["content"]
 
-        html_content = read_tab(tab_content, valid_urls)
+        tab_id = tab["tabProperties"].get("tabId")
+        if rendered is not None and tab_id in rendered:
+            html_content, error = rendered[tab_id]     # pre-rendered by render_tabs_in_pool
+            if error is not None:
+                raise error
+        else:
+            html_content = read_tab(tab_content, valid_urls)
 
         html_content_dict = {}
         html_content_dict.update({city_name: html_content})
@@ -191,6 +338,7 @@ def process_tab_and_child_tabs(tab, progress, flat_cities_list, valid_urls, doc_
         if not html_content.strip():     # checks if the content is empty. If so skipping the tab
             logger.warning(f"🈳 Tab '{city_name}' is empty. Skipping...")
             counter['empty_tab_count'] += 1
+            counter['unpublishable'][city_name] = "empty"
             return {}
     
         subtabs_list = tab.get("childTabs")
@@ -199,7 +347,7 @@ def process_tab_and_child_tabs(tab, progress, flat_cities_list, valid_urls, doc_
             logger.info(f"Found {len(subtabs_list)} child tab/tabs in '{city_name}'. Recursing...")
 
             for subtab in subtabs_list:
-               subtab_html_dict = process_tab_and_child_tabs(subtab, progress, flat_cities_list, valid_urls, doc_id, logger, counter)
+               subtab_html_dict = process_tab_and_child_tabs(subtab, progress, flat_cities_list, valid_urls, doc_id, logger, counter, rendered, matcher)
                html_content_dict.update(subtab_html_dict)
                counter['subtab_count'] += 1
                
@@ -208,4 +356,5 @@ def process_tab_and_child_tabs(tab, progress, flat_cities_list, valid_urls, doc_
     except ValueError as ve:
         logger.warning(f"🚫 Skipping tab '{city_name}' due to invalid internal link: {ve}. Check all the internal links.")
         counter['wrong_internal_link_content_count'] += 1
+        counter['unpublishable'][city_name] = "invalid internal link"
         return {}
\ No newline at end of file
@@ -0,0 +1,120 @@
+import os
+import time
+import threading
+from logging_config import logger
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "60"))
+
+
+class CircuitBreaker:
+    """
+    Fail fast after repeated errors from a remote service.
+
+    closed    -> calls go through; consecutive failures are counted
+    open      -> calls are refused until reset_timeout has passed
+    half_open -> one probe call is let through; success closes the breaker, failure re-opens it
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may be attempted now."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                logger.info(f"🔌 {self.name} circuit half-open. Sending a probe request.")
+
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"✅ {self.name} circuit closed. Service recovered.")
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                logger.warning(f"⚡ {self.name} circuit open after {self.failures} failures. Failing fast for {self.reset_timeout:.0f}s.")
+
+    def record_status(self, status_code):
+        """Count 5xx responses as failures; anything else (4xx included) means the service is up."""
+        if status_code >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def release(self):
+        """End a probe that finished without reaching the service, so the next call can probe again."""
+        with self._lock:
+            self._probing = False
+
+
+class RunBudget:
+    """Stop a run cleanly once its deadline or page budget is used up. 0 means unlimited."""
+
+    def __init__(self, deadline_minutes=0, max_pages=0):
+        self.deadline = time.monotonic() + deadline_minutes * 60 if deadline_minutes else None
+        self.max_pages = max_pages
+        self.pages = 0
+
+    def record_page(self):
+        self.pages += 1
+
+    def exhausted(self, in_flight=0):
+        """
+        Return the reason the budget is used up, or None while there is budget left.
+        in_flight counts pages already handed to a sink that only reports them later (drafts, bulk chunks).
+        """
+        if self.max_pages and self.pages + in_flight >= self.max_pages:
+            return f"page budget of {self.max_pages} reached"
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "run deadline reached"
+        return None
+
+
+class RateLimiter:
+    """Space calls at least 60 / requests_per_minute seconds apart across threads. 0 means unlimited."""
+
+    def __init__(self, requests_per_minute=0):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0
+        self.next_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self.next_at)
+            self.next_at = start + self.interval
+
+        if start > now:
+            time.sleep(start - now)
+
+
+wp_breaker = CircuitBreaker("WordPress")
+sheets_breaker = CircuitBreaker("Google Sheets")
@@ -0,0 +1,64 @@
+from logging_config import logger
+
+
+def column_index(column):
+    """Convert a sheet column letter (A, B, ..., AA) to a zero-based index."""
+    index = 0
+    for char in column.strip().upper():
+        index = index * 26 + (ord(char) - ord("A") + 1)
+    return index - 1
+
+
+def parse_priority(value):
+    """Parse a priority cell such as '1,234' or '56.7'. Blank or non-numeric cells rank last."""
+    try:
+        return float(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def load_priorities(sheet_service, spreadsheet_id, sheet_name, priority_column):
+    """Read {city: priority} from the city column and an optional priority column of the sheet."""
+    try:
+        result = sheet_service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"{sheet_name}!A2:{priority_column}"
+        ).execute()
+
+        col = column_index(priority_column)
+        priorities = {}
+        for row in result.get("values", []):
+            if not row or not row[0].strip():
+                continue
+            priorities[row[0].strip()] = parse_priority(row[col]) if len(row) > col else 0.0
+
+        logger.info(f"📊 Loaded priorities for {len(priorities)} cities from column {priority_column}.")
+        return priorities
+
+    except Exception as e:
+        logger.warning(f"⚠️ Could not load priorities from column {priority_column}, keeping doc order: {e}")
+        return {}
+
+
+def tab_titles(tab):
+    """Yield the titles of a tab and all of its child tabs."""
+    yield tab["tabProperties"]["title"].strip()
+    for subtab in tab.get("childTabs") or []:
+        yield from tab_titles(subtab)
+
+
+def order_tabs(tabs, priorities, priority_cities):
+    """
+    Order tabs so the most valuable pages publish first.
+    Cities listed in PRIORITY_CITIES come first, in the listed order. The rest sort by sheet priority,
+    highest first. A tab ranks by its best city, counting child tabs. Ties keep document order.
+    """
+    pinned = {city: position for position, city in enumerate(priority_cities)}
+
+    def sort_key(tab):
+        titles = list(tab_titles(tab))
+        pin = min((pinned[t] for t in titles if t in pinned), default=len(pinned))
+        score = max((priorities.get(t, 0.0) for t in titles), default=0.0)
+        return (pin, -score)
+
+    return sorted(tabs, key=sort_key)    # sorted() is stable, so equal keys stay in doc order
@@ -0,0 +1,523 @@
+import os
+import json
+import threading
+import requests
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from logging_config import logger
+
+from post import post_to_wp, update_new_content, bulk_upsert_pages, with_featured_image, publish_pages_batch, wp_batch_url
+from write_url import write_url_to_sheet
+from resilience import wp_breaker
+
+# A sink receives rendered pages from pipeline.run_pipeline.
+#   publish(city_name, html_content, counters) -> list of city names that are now done
+#   flush(counters)                            -> same, for anything the sink was batching
+#   in_flight()                                -> optional: pages accepted but not returned yet, so they
+#                                                 count against MAX_PAGES_PER_RUN from the moment they are submitted
+# The pipeline records progress for every returned city exactly once.
+
+
+class SheetWrites:
+    """
+    A sink's write-backs to the sheet. write() and flush() return the cities that are now done: a city is done
+    once its write succeeded. For created pages (created=True) a failed write never holds the city back, since
+    running it again would create a duplicate page: the write is kept in pending for the next run, or logged
+    when there is no pending store. With a concurrent writer, a queued write's city is only returned after the
+    write has finished. track=False writes (e.g. the page ID column) never hold a city back.
+    """
+
+    def __init__(self, config, sheet_service, cities, sheet_writer=None, pending=None, created=False):
+        self.config = config
+        self.sheet_service = sheet_service
+        self.cities = cities
+        self.sheet_writer = sheet_writer
+        self.pending = pending
+        self.created = created
+        self.queued = []    # (future, city_name, column, value, track)
+
+    def write(self, city_name, column, value, track=True):
+        args = (self.config["spreadsheet_id"], self.config["sheet_name"], column, value, city_name, self.cities, logger)
+        if self.sheet_writer:
+            self.queued.append((self.sheet_writer.submit(*args), city_name, column, value, track))
+            return self.finished()
+
+        done = [city_name] if write_url_to_sheet(self.sheet_service, *args) else self.failed(city_name, column, value)
+        return done if track else []
+
+    def failed(self, city_name, column, value):
+        if not self.created:
+            logger.warning(f"⚠️ Sheet write for '{city_name}' failed. Leaving the city for the next run.")
+            return []
+        if self.pending is None:
+            logger.error(f"❌ Sheet write for '{city_name}' failed and SHEET_RETRY_FILE is off. Write '{value}' to column {column} by hand.")
+            return [city_name]
+        self.pending.add(self.config["spreadsheet_id"], self.config["sheet_name"], column, value, city_name)
+        logger.warning(f"⚠️ Sheet write for '{city_name}' failed. Kept in {self.pending.path} to retry on the next run.")
+        return [city_name]
+
+    def finished(self, wait=False):
+        """Collect the queued writes that are done (all of them with wait=True)."""
+        done, still_queued = [], []
+        for entry in self.queued:
+            future, city_name, column, value, track = entry
+            if not wait and not future.done():
+                still_queued.append(entry)
+                continue
+            settled = [city_name] if future.result() else self.failed(city_name, column, value)
+            if track:
+                done += settled
+        self.queued = still_queued
+        return done
+
+    def in_flight(self):
+        return sum(1 for entry in self.queued if entry[4])
+
+    def flush(self):
+        done = self.finished(wait=True)
+        if self.sheet_writer:
+            self.sheet_writer.flush()   # logs the failure summary
+        return done
+
+
+def format_page_meta(config, city_name):
+    """Format page title, key phrase and meta description for a city."""
+    page_title = config["page_title_format"].format(
+        category_name=config["category_name"],
+        city_name=city_name,
+        brand_name=config["brand_name"]
+    )
+    key_phrase = config["key_phrase_format"].format(
+        category_name=config["category_name"],
+        city_name=city_name
+    )
+    description = config["description_format"].format(
+        category_name=config["category_name"],
+        city_name=city_name,
+        country_name=config["country_name"]
+    )
+    return page_title, key_phrase, description
+
+
+def record_created_page(registry, sheet_writes, config, city_name, page):
+    """Keep a created page's ID in the page registry and, when PAGE_ID_COLUMN is set, in the sheet."""
+    if registry is not None:
+        registry.record(city_name, page)
+
+    if config.get("page_id_column") and page.get("id"):
+        sheet_writes.write(city_name, config["page_id_column"], str(page["id"]), track=False)
+
+
+class CreatePageSink:
+    """Create a new WordPress page per city and write its URL back to the sheet (app.py)."""
+
+    def __init__(self, config, sheet_service, cities, sheet_writer=None, breaker=wp_breaker, registry=None, pending_writes=None):
+        self.config = config
+        self.cities = cities
+        self.sheet_writes = SheetWrites(config, sheet_service, cities, sheet_writer, pending_writes, created=True)
+        self.breaker = breaker
+        self.registry = registry
+
+    def publish(self, city_name, html_content, counters):
+        config = self.config
+        page_title, key_phrase, description = format_page_meta(config, city_name)
+
+        response = post_to_wp(
+            html_content,
+            config["featured_img_url"],
+            page_title,
+            config["brand_name"],
+            key_phrase,
+            description,
+            config["social_image"],
+            config["wp_url"],
+            config["wp_username"],
+            config["wp_app_password"],
+            breaker=self.breaker
+        )
+
+        if not response:
+            logger.warning(f"⚠️ No response for '{city_name}'. Skipping.")
+            return []
+
+        if response.status_code != 201:
+            logger.error(f"❌ Failed to post '{city_name}': {response.status_code} - {response.text}")
+            return []
+
+        page = response.json()
+        page_url = page.get("link", "")
+        logger.info(f"✅ Created page for '{city_name}': {page_url}")
+
+        done = self.sheet_writes.write(city_name, config["url_column"], page_url)
+        record_created_page(self.registry, self.sheet_writes, config, city_name, page)
+        return done
+
+    def flush(self, counters):
+        done = self.sheet_writes.flush()
+        if self.registry is not None:
+            self.registry.save()
+        return done
+
+    def in_flight(self):
+        return self.sheet_writes.in_flight()
+
+
+def load_drafts(drafts_file, doc_id):
+    """Load {city: {"id": page_id}} for drafts created but not yet published."""
+    try:
+        if os.path.exists(drafts_file):
+            with open(drafts_file, "r") as f:
+                return json.load(f).get(doc_id, {})
+    except Exception as e:
+        logger.warning(f"⚠️ Ignoring unreadable drafts file {drafts_file}: {e}")
+    return {}
+
+
+def save_drafts(drafts_file, doc_id, drafts):
+    try:
+        all_drafts = {}
+        if os.path.exists(drafts_file):
+            with open(drafts_file, "r") as f:
+                all_drafts = json.load(f)
+        all_drafts[doc_id] = drafts
+        with open(drafts_file, "w") as f:
+            json.dump(all_drafts, f, indent=4)
+    except Exception as e:
+        logger.exception(f"⚠️ Failed to save drafts: {e}")
+
+
+class DraftPublishSink:
+    """
+    Two-phase create (PUBLISH_MODE=draft, app.py).
+    Phase 1 creates every page as a draft on worker threads, so no publish hooks (sitemap, cache purge, SEO) run per page.
+    Phase 2 (flush) publishes the drafts through /batch/v1, 25 per request, then writes the live URLs to the sheet.
+    Drafts are tracked in the drafts file, so an interrupted or failed run publishes them next time instead of creating duplicates.
+    """
+
+    BATCH_SIZE = 25     # WordPress caps /batch/v1 at 25 requests
+
+    def __init__(self, config, sheet_service, cities, sheet_writer=None, registry=None, pending_writes=None):
+        self.config = config
+        self.cities = cities
+        self.sheet_writes = SheetWrites(config, sheet_service, cities, sheet_writer, pending_writes, created=True)
+        self.registry = registry
+        self.drafts = load_drafts(config["drafts_file"], config["doc_id"])
+        self.failed = []
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=config["draft_workers"], thread_name_prefix="draft")
+        self.futures = []
+        self.earlier_drafts = len(self.drafts)
+        self.submitted = 0
+
+        if self.drafts:
+            logger.info(f"📝 {len(self.drafts)} drafts from an earlier run are waiting to be published.")
+
+    def publish(self, city_name, html_content, counters):
+        if city_name in self.drafts:
+            logger.info(f"📝 Draft for '{city_name}' already exists (ID {self.drafts[city_name]['id']}). Publishing it in phase 2.")
+            return []
+
+        self.futures.append(self.executor.submit(self.create_draft, city_name, html_content))
+        self.submitted += 1
+        return []
+
+    def in_flight(self):
+        """Drafts submitted this run plus drafts left by earlier runs: all of them are published by flush()."""
+        with self.lock:
+            return self.earlier_drafts + self.submitted - len(self.failed)
+
+    def create_draft(self, city_name, html_content):
+        config = self.config
+        page_title, key_phrase, description = format_page_meta(config, city_name)
+
+        try:
+            response = post_to_wp(
+                html_content,
+                config["featured_img_url"],
+                page_title,
+                config["brand_name"],
+                key_phrase,
+                description,
+                config["social_image"],
+                config["wp_url"],
+                config["wp_username"],
+                config["wp_app_password"],
+                status="draft"
+            )
+
+            if not response or response.status_code != 201:
+                detail = f"{response.status_code} - {response.text}" if response is not None else "no response"
+                raise ValueError(detail)
+
+            page_id = response.json()["id"]
+
+        except Exception as e:
+            logger.error(f"❌ Failed to create draft for '{city_name}': {e}")
+            with self.lock:
+                self.failed.append(city_name)
+            return
+
+        with self.lock:
+            self.drafts[city_name] = {"id": page_id}
+            save_drafts(config["drafts_file"], config["doc_id"], self.drafts)
+        logger.info(f"📝 Created draft for '{city_name}' (ID {page_id})")
+
+    def flush(self, counters):
+        for future in self.futures:
+            future.result()
+        self.futures = []
+        self.executor.shutdown(wait=True)
+
+        # The run's check: publish only when every page of this run made it to a draft
+        if self.failed:
+            logger.warning(f"⚠️ {len(self.failed)} drafts failed ({', '.join(self.failed)}). Leaving {len(self.drafts)} drafts unpublished; rerun to retry and publish.")
+            return []
+
+        config = self.config
+        batch_url = wp_batch_url(config["wp_url"])
+        pending = list(self.drafts.items())
+        done = []
+
+        for start in range(0, len(pending), self.BATCH_SIZE):
+            chunk = pending[start:start + self.BATCH_SIZE]
+            results = publish_pages_batch([draft["id"] for _, draft in chunk], batch_url, config["wp_username"], config["wp_app_password"])
+
+            if results is None:
+                logger.warning(f"⚠️ Batch publish failed for {len(chunk)} drafts. They stay in {config['drafts_file']}.")
+                continue
+
+            for (city_name, draft), result in zip(chunk, results):
+                body = result.get("body") or {}
+                if result.get("status") != 200:
+                    logger.error(f"❌ Failed to publish draft {draft['id']} for '{city_name}': {result.get('status')} - {body.get('message', body)}")
+                    continue
+
+                page_url = body.get("link", "")
+                logger.info(f"✅ Created page for '{city_name}': {page_url}")
+                done += self.sheet_writes.write(city_name, config["url_column"], page_url)
+                record_created_page(self.registry, self.sheet_writes, config, city_name, body)
+                del self.drafts[city_name]     # published: the draft is never published twice, whatever the sheet write did
+
+        save_drafts(config["drafts_file"], config["doc_id"], self.drafts)
+        done += self.sheet_writes.flush()
+        if self.registry is not None:
+            self.registry.save()
+        return done
+
+
+def get_wp_page_id(base_url, slug, auth):
+    """Fetch WordPress page ID safely."""
+    page = get_wp_page(base_url, slug, auth)
+    return page["id"] if page else None
+
+
+def get_wp_page(base_url, slug, auth):
+    """Fetch the WordPress page object for a slug safely."""
+    if not wp_breaker.allow():
+        logger.warning(f"⚡ WordPress circuit open. Not looking up slug '{slug}'.")
+        return None
+
+    try:
+        res = requests.get(f"{base_url}?slug={slug}", auth=auth, timeout=15)
+        wp_breaker.record_status(res.status_code)
+        res.raise_for_status()
+        data = res.json()
+        if not data or not isinstance(data, list) or "id" not in data[0]:
+            raise ValueError("Invalid WordPress page response format.")
+        return data[0]
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+        wp_breaker.record_failure()
+        logger.error(f"❌ Failed to fetch WP page for slug '{slug}': {e}")
+        return None
+    except Exception as e:
+        logger.error(f"❌ Failed to fetch WP page for slug '{slug}': {e}")
+        return None
+    finally:
+        wp_breaker.release()
+
+
+def update_wp_page(page_id, city_name, html_content, base_url, auth, featured_img, revisions=None, expected_modified=None):
+    """Update WordPress page content. Returns the updated page object, None when the page ID does not exist, or False."""
+    try:
+        res = update_new_content(city_name, html_content, base_url, page_id, auth.username, auth.password, featured_img, revisions, expected_modified)
+        if res.status_code == 200:
+            logger.info(f"✅ Updated WP page ID {page_id} for city '{city_name}'")
+            return res.json() or {"id": page_id}
+        elif res.status_code == 409:
+            logger.warning(f"⚠️ Page ID {page_id} for '{city_name}' was edited in WordPress since it was last published. Not overwriting it.")
+            return False
+        elif res.status_code == 404:
+            logger.warning(f"⚠️ WP page ID {page_id} for '{city_name}' no longer exists.")
+            return None
+        else:
+            logger.warning(f"⚠️ WP update failed ({res.status_code}): {res.text}")
+            return False
+    except Exception as e:
+        logger.error(f"❌ Exception updating WP page ID {page_id}: {e}")
+        return False
+
+
+class UpdatePageSink:
+    """Replace the content of the existing page for each city and mark it in the sheet (content_replacer.py)."""
+
+    update_msg = '✅ Content updated'
+
+    def __init__(self, env, sheet_service, city_urls, auth, sheet_writer=None, registry=None):
+        self.env = env
+        self.city_urls = city_urls
+        self.cities = city_urls.keys()
+        self.auth = auth
+        # No pending store: an update whose mark fails is simply not committed and runs again next time
+        self.sheet_writes = SheetWrites(env, sheet_service, self.cities, sheet_writer)
+        self.registry = registry
+        self.pending = []  # bulk upsert items waiting for a full chunk
+
+    def mark_updated(self, city_name):
+        """Write the update message for a city; returns the cities that are now done."""
+        if not self.env["update_column"]:     # UPDATE_COLUMN is optional: nothing to mark
+            return [city_name]
+        return self.sheet_writes.write(city_name, self.env["update_column"], self.update_msg)
+
+    def mark_args(self, city_name):
+        """write_url_to_sheet arguments (after the Sheets client) of a city's update message, or None without UPDATE_COLUMN."""
+        env = self.env
+        if not env["update_column"]:
+            return None
+        return env["spreadsheet_id"], env["sheet_name"], env["update_column"], self.update_msg, city_name, self.cities, logger
+
+    def prepare(self, city_name, counters):
+        """Check a rendered city against the sheet. Returns {city_name, page_url, slug, entry} or None."""
+        if city_name not in self.cities:
+            logger.warning(f"⚠️ City '{city_name}' not found in sheet.")
+            counters['wrong_city_name_count'] += 1
+            return None
+
+        page_url = self.city_urls[city_name]
+        slug = urlparse(page_url).path.strip("/")
+        if not slug:
+            logger.warning(f"⚠️ Invalid slug for '{city_name}': {page_url}")
+            return None
+
+        entry = self.registry.lookup(page_url) if self.registry is not None else None
+        return {"city_name": city_name, "page_url": page_url, "slug": slug, "entry": entry}
+
+    def lookup(self, target):
+        """Lookup stage: (page_id, expected_modified) for a prepared city, page_id None when WordPress has no such page."""
+        entry = target["entry"]
+        if entry:
+            # No slug query: the ID was recorded when the page was created or last looked up
+            return entry["id"], entry.get("modified") if self.env["conflict_check"] else None
+
+        page = get_wp_page(self.env["WP_BASE"], target["slug"], self.auth)
+        if not page:
+            logger.warning(f"⚠️ Invalid page_id for '{target['city_name']}': {target['page_url']}")
+            return None, None
+        if self.registry is not None:
+            self.registry.record(target["city_name"], page)
+        return page["id"], None
+
+    def update(self, target, page_id, html_content, expected_modified):
+        """Update stage: replace the page content. Returns True when WordPress accepted it."""
+        env = self.env
+        updated = update_wp_page(page_id, target["city_name"], html_content, env["WP_BASE"], self.auth, env["new_img"], env["revisions"], expected_modified)
+        if updated is None and target["entry"]:
+            # The registry's ID is stale: drop it and resolve the page by slug once
+            self.registry.forget(target["page_url"])
+            target["entry"] = None
+            page_id, expected_modified = self.lookup(target)
+            if not page_id:
+                return False
+            updated = update_wp_page(page_id, target["city_name"], html_content, env["WP_BASE"], self.auth, env["new_img"], env["revisions"], expected_modified)
+        if not updated:
+            return False
+        if self.registry is not None:
+            self.registry.touch(target["page_url"], updated.get("modified_gmt"))
+        return True
+
+    def publish(self, city_name, html_content, counters):
+        target = self.prepare(city_name, counters)
+        if target is None:
+            return []
+
+        if self.env["wp_bulk_url"]:
+            target["html_content"] = html_content
+            self.pending.append(target)
+            if len(self.pending) >= self.env["bulk_chunk_size"]:
+                return self.send_bulk(counters)
+            return []
+
+        page_id, expected_modified = self.lookup(target)
+        if not page_id or not self.update(target, page_id, html_content, expected_modified):
+            counters["skipped_count"] += 1
+            return []
+
+        return self.mark_updated(city_name)
+
+    def flush(self, counters):
+        done = self.send_bulk(counters)
+        done += self.sheet_writes.flush()
+        if self.registry is not None:
+            self.registry.save()
+        return done
+
+    def in_flight(self):
+        return len(self.pending) + self.sheet_writes.in_flight()
+
+    def send_bulk(self, counters):
+        """Send pending page updates through the bulk upsert route and return the updated cities."""
+        pending, self.pending = self.pending, []
+        if not pending:
+            return []
+        return self.upsert(pending, counters)
+
+    def upsert(self, pending, counters):
+        env = self.env
+        items = []
+        for item in pending:
+            bulk_item = {"slug": item["slug"], "content": with_featured_image(item["html_content"], env["new_img"]), "meta": {}, "create": False}
+            if item["entry"]:
+                bulk_item["id"] = item["entry"]["id"]
+                if env["conflict_check"] and item["entry"].get("modified"):
+                    bulk_item["modified"] = item["entry"]["modified"]
+            items.append(bulk_item)
+        results = bulk_upsert_pages(items, env["wp_bulk_url"], self.auth.username, self.auth.password, env["revisions"])
+
+        if results is None:
+            logger.warning(f"⚠️ Bulk upsert failed for {len(pending)} pages. Skipping chunk.")
+            counters["skipped_count"] += len(pending)
+            return []
+
+        done = []
+        stale = []
+        for item, result in zip(pending, results):
+            city_name = item["city_name"]
+
+            if result.get("status") == "updated":
+                logger.info(f"✅ Updated WP page ID {result.get('id')} for city '{city_name}'")
+                if self.registry is not None:
+                    if item["entry"]:
+                        self.registry.touch(item["page_url"], result.get("modified_gmt"))
+                    else:
+                        self.registry.record(city_name, result)
+                done += self.mark_updated(city_name)
+            elif result.get("status") == "conflict":
+                logger.warning(f"⚠️ Page ID {result.get('id')} for '{city_name}' was edited in WordPress since it was last published. Not overwriting it.")
+                counters["skipped_count"] += 1
+            elif result.get("status") == "not_found" and item["entry"]:
+                stale.append(item)
+            elif result.get("status") == "not_found":
+                logger.warning(f"⚠️ Invalid page_id for '{city_name}': no page with slug '{item['slug']}'")
+                counters["skipped_count"] += 1
+            else:
+                logger.warning(f"⚠️ Bulk update failed for '{city_name}': {result.get('message', result)}")
+                counters["skipped_count"] += 1
+
+        if stale:
+            # Registry IDs WordPress no longer knows: drop them and send the pages again by slug
+            logger.warning(f"🔁 {len(stale)} page IDs from the page registry no longer exist. Retrying them by slug.")
+            for item in stale:
+                self.registry.forget(item["page_url"])
+                item["entry"] = None
+            done += self.upsert(stale, counters)
+
+        return done
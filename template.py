@@ -0,0 +1,142 @@
+import re
+import html
+from logging_config import logger
+
+from read import read_tab
+from scheduler import load_priorities
+
+# {{ city_name }}, {{population}}, ... in the master tab text
+PLACEHOLDER_RE = re.compile(r"\{\{\s*([A-Za-z0-9_]+)\s*\}\}")
+
+# Available in every template even when the sheet has no column for them
+CONFIG_VARIABLES = ("country_name", "category_name", "brand_name")
+
+
+def variable_name(header):
+    """'City Name' -> 'city_name'"""
+    return re.sub(r"[^a-z0-9]+", "_", header.strip().lower()).strip("_")
+
+
+def compile_template(template_html):
+    """
+    Split rendered template HTML into ([literal, literal, ...], [name, ...]) around its placeholders,
+    so each city is a single join instead of a re-render.
+    """
+    literals, names = [], []
+    position = 0
+    for match in PLACEHOLDER_RE.finditer(template_html):
+        literals.append(template_html[position:match.start()])
+        names.append(match.group(1).lower())
+        position = match.end()
+    literals.append(template_html[position:])
+    return literals, names
+
+
+def render_template(compiled, values):
+    """Substitute HTML-escaped values into a compiled template."""
+    literals, names = compiled
+    parts = [literals[0]]
+    for name, literal in zip(names, literals[1:]):
+        parts.append(html.escape(values.get(name, "")))
+        parts.append(literal)
+    return "".join(parts)
+
+
+def load_template_values(sheet_service, spreadsheet_id, sheet_name, config):
+    """Read {city: {variable: value}} from the sheet: row 1 holds the variable names, column A the city."""
+    result = sheet_service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id,
+        range=f"{sheet_name}!A1:ZZ"
+    ).execute()
+
+    rows = result.get("values", [])
+    if len(rows) < 2:
+        raise ValueError(f"No template values found in '{sheet_name}'.")
+
+    names = [variable_name(header) for header in rows[0]]
+    defaults = {name: str(config[name]) for name in CONFIG_VARIABLES if config.get(name)}
+
+    values = {}
+    for row in rows[1:]:
+        if not row or not row[0].strip():
+            continue
+        city_name = row[0].strip()
+        city_values = dict(defaults)
+        city_values.update({name: cell.strip() for name, cell in zip(names, row) if name})
+        city_values["city_name"] = city_name
+        values[city_name] = city_values
+
+    logger.info(f"📊 Loaded template values for {len(values)} cities ({', '.join(n for n in names if n)}) from '{sheet_name}'.")
+    return values
+
+
+def find_template_tab(tabs, title):
+    for tab in tabs:
+        if tab["tabProperties"]["title"].strip() == title:
+            return tab
+        found = find_template_tab(tab.get("childTabs", []), title)
+        if found:
+            return found
+    return None
+
+
+class TemplateRenderer:
+    """Render function for pipeline.run_pipeline in template mode: one 'tab' per city, filled from the compiled template."""
+
+    def __init__(self, compiled, values, progress, doc_id):
+        self.compiled = compiled
+        self.values = values
+        self.progress = progress
+        self.doc_id = doc_id
+
+    def __call__(self, city_name, counters):
+        if city_name in self.progress[self.doc_id]:
+            logger.info(f"⏩ Skipping already processed city: '{city_name}'")
+            counters['skipped_count'] += 1
+            return {}
+
+        logger.info(f"Rendering '{city_name}' from template...")
+        return {city_name: render_template(self.compiled, self.values[city_name])}
+
+
+def template_source(doc, config, sheet_service, cities, progress):
+    """
+    Source + render for template mode (TEMPLATE_TAB): the master tab is rendered and compiled once,
+    and every city of the sheet becomes a page. Returns (cities in publish order, renderer).
+    """
+    tab = find_template_tab(doc.get("tabs", []), config["template_tab"])
+    if tab is None:
+        logger.error(f"❌ Template tab '{config['template_tab']}' not found in the document.")
+        exit(1)
+
+    try:
+        template_html = read_tab(tab["documentTab"]["body"]["content"], config["valid_urls"])
+    except ValueError as ve:
+        logger.error(f"❌ Template tab has an invalid internal link: {ve}")
+        exit(1)
+
+    compiled = compile_template(template_html)
+    values = load_template_values(sheet_service, config["spreadsheet_id"], config["template_sheet"] or config["sheet_name"], config)
+
+    known = set(CONFIG_VARIABLES) | {"city_name"} | {name for city_values in values.values() for name in city_values}
+    unknown = sorted(set(compiled[1]) - known)
+    if unknown:
+        logger.error(f"❌ Template placeholders with no sheet column: {', '.join(unknown)}")
+        exit(1)
+
+    logger.info(f"🧩 Compiled template '{config['template_tab']}' with {len(compiled[1])} placeholders ({', '.join(sorted(set(compiled[1])))}).")
+
+    sheet_cities = {city.strip() for city in cities}
+    pending = [city for city in values if city in sheet_cities]
+    missing = [city for city in values if city not in sheet_cities]
+    if missing:
+        logger.warning(f"⚠️ {len(missing)} template rows are not in the city list and will be skipped: {', '.join(missing[:10])}")
+
+    if config["priority_column"] or config["priority_cities"]:
+        priorities = {}
+        if config["priority_column"]:
+            priorities = load_priorities(sheet_service, config["spreadsheet_id"], config["sheet_name"], config["priority_column"])
+        pinned = {city: i for i, city in enumerate(config["priority_cities"])}
+        pending.sort(key=lambda city: (pinned.get(city, len(pinned)), -priorities.get(city, 0.0)))
+
+    return pending, TemplateRenderer(compiled, values, progress, config["doc_id"])
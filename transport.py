@@ -0,0 +1,245 @@
+"""
+Record/replay of every HTTP exchange, for reproducing a real run offline.
+
+TRANSPORT_MODE=record   capture Docs/Sheets (httplib2) and WordPress/OAuth (requests) traffic to TRANSPORT_ARCHIVE
+TRANSPORT_MODE=replay   serve the recorded responses instead of touching the network, sleeping for the
+                        recorded latency times REPLAY_LATENCY_SCALE (0 replays as fast as possible)
+
+The archive is gzip JSONL, one exchange per line. Authorization headers and request bodies are never
+written (only their size), secret query parameters and token fields in responses are redacted.
+Replay matches on method + URL and serves each URL's responses in recorded order.
+"""
+import os
+import gzip
+import json
+import time
+import atexit
+import base64
+import threading
+from collections import defaultdict, deque
+from datetime import timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from logging_config import logger
+
+TRANSPORT_MODE = os.getenv("TRANSPORT_MODE", "").strip().lower()
+TRANSPORT_ARCHIVE = os.getenv("TRANSPORT_ARCHIVE", "recordings/run.jsonl.gz")
+REPLAY_LATENCY_SCALE = float(os.getenv("REPLAY_LATENCY_SCALE", "1.0"))
+
+SECRET_PARAMS = {"key", "access_token", "token", "password", "client_secret", "assertion", "refresh_token"}
+SECRET_FIELDS = {"access_token", "id_token", "refresh_token", "token", "password", "client_secret"}
+KEPT_HEADERS = {"content-type", "content-encoding", "location", "x-wp-total", "x-wp-totalpages", "retry-after"}
+REDACTED = "REDACTED"
+
+_installed = False
+
+
+def redact_url(url):
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = [(k, REDACTED if k.lower() in SECRET_PARAMS else v) for k, v in parse_qsl(parts.query, keep_blank_values=True)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def redact_json(value):
+    if isinstance(value, dict):
+        return {k: REDACTED if k.lower() in SECRET_FIELDS and isinstance(v, str) else redact_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact_json(v) for v in value]
+    return value
+
+
+def redact_body(content, content_type):
+    """Redact token fields from JSON response bodies; other bodies are stored as they are."""
+    if "json" not in (content_type or ""):
+        return content
+    try:
+        return json.dumps(redact_json(json.loads(content)), separators=(",", ":")).encode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        return content
+
+
+def body_size(body):
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    return -1    # streamed / generator body
+
+
+class Recorder:
+    """Append redacted exchanges to the gzip JSONL archive. Safe to call from worker threads."""
+
+    def __init__(self, path):
+        archive_dir = os.path.dirname(path)
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+        self.path = path
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.count = 0
+
+    def record(self, lib, method, url, request_body, status, headers, content, elapsed):
+        headers = {k.lower(): v for k, v in headers.items() if k.lower() in KEPT_HEADERS}
+        content = redact_body(content or b"", headers.get("content-type"))
+
+        entry = {
+            "t": round(time.monotonic() - self.started - elapsed, 4),
+            "lib": lib,
+            "method": method.upper(),
+            "url": redact_url(url),
+            "request_bytes": body_size(request_body),
+            "status": status,
+            "headers": headers,
+            "elapsed": round(elapsed, 4)
+        }
+        try:
+            entry["body"] = content.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["body_b64"] = base64.b64encode(content).decode("ascii")
+
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self.lock:
+            self.file.write(line + "\n")
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        logger.info(f"📼 Recorded {self.count} HTTP exchanges to {self.path}")
+
+
+class Replayer:
+    """Serve recorded exchanges by method + URL, in recorded order."""
+
+    def __init__(self, path, latency_scale):
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.exchanges = defaultdict(deque)
+        self.served = 0
+        self.missed = 0
+
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                self.exchanges[(entry["method"], entry["url"])].append(entry)
+
+        logger.info(f"📼 Replaying {sum(len(q) for q in self.exchanges.values())} HTTP exchanges from {path} (latency x{latency_scale})")
+
+    def next(self, method, url):
+        """Pop the next recorded exchange for this request (after its scaled latency), or None."""
+        key = (method.upper(), redact_url(url))
+        with self.lock:
+            queue = self.exchanges.get(key)
+            entry = queue.popleft() if queue else None
+            if entry is None:
+                self.missed += 1
+            else:
+                self.served += 1
+
+        if entry is None:
+            logger.error(f"📼 No recorded response left for {key[0]} {key[1]}")
+            return None
+
+        if self.latency_scale > 0:
+            time.sleep(entry["elapsed"] * self.latency_scale)
+
+        if "body_b64" in entry:
+            entry["content"] = base64.b64decode(entry["body_b64"])
+        else:
+            entry["content"] = entry.get("body", "").encode("utf-8")
+        return entry
+
+    def close(self):
+        left = sum(len(q) for q in self.exchanges.values())
+        logger.info(f"📼 Replay served {self.served} exchanges, {self.missed} unmatched requests, {left} recordings unused.")
+
+
+def _patch_requests(recorder, replayer):
+    import requests
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    original_send = requests.sessions.Session.send
+
+    def send(session, request, **kwargs):
+        if replayer is not None:
+            entry = replayer.next(request.method, request.url)
+            if entry is None:
+                raise requests.exceptions.ConnectionError(f"No recorded response for {request.method} {redact_url(request.url)}", request=request)
+
+            response = requests.Response()
+            response.status_code = entry["status"]
+            response.headers = CaseInsensitiveDict(entry["headers"])
+            response._content = entry["content"]
+            response.encoding = get_encoding_from_headers(response.headers)
+            response.url = request.url
+            response.request = request
+            response.reason = "Replayed"
+            response.elapsed = timedelta(seconds=entry["elapsed"])
+            return response
+
+        started = time.monotonic()
+        response = original_send(session, request, **kwargs)
+        recorder.record("requests", request.method, request.url, request.body, response.status_code,
+                        response.headers, response.content, time.monotonic() - started)
+        return response
+
+    requests.sessions.Session.send = send
+
+
+def _patch_httplib2(recorder, replayer):
+    try:
+        import httplib2
+    except ImportError:
+        return
+
+    original_request = httplib2.Http.request
+
+    def request(http, uri, method="GET", body=None, headers=None, *args, **kwargs):
+        if replayer is not None:
+            entry = replayer.next(method, uri)
+            if entry is None:
+                raise httplib2.HttpLib2Error(f"No recorded response for {method} {redact_url(uri)}")
+
+            info = dict(entry["headers"])
+            info["status"] = str(entry["status"])
+            return httplib2.Response(info), entry["content"]
+
+        started = time.monotonic()
+        response, content = original_request(http, uri, method, body, headers, *args, **kwargs)
+        headers_out = {k: v for k, v in response.items() if k != "status"}
+        recorder.record("httplib2", method, uri, body, response.status, headers_out, content, time.monotonic() - started)
+        return response, content
+
+    httplib2.Http.request = request
+
+
+def install_transport(mode=TRANSPORT_MODE, archive=TRANSPORT_ARCHIVE, latency_scale=REPLAY_LATENCY_SCALE):
+    """Patch requests and httplib2 for record or replay mode. Does nothing when mode is empty/off."""
+    global _installed
+    if _installed or mode in ("", "off"):
+        return
+
+    if mode == "record":
+        recorder, replayer = Recorder(archive), None
+        atexit.register(recorder.close)
+        logger.info(f"📼 Recording HTTP traffic to {archive}")
+    elif mode == "replay":
+        if not os.path.exists(archive):
+            logger.error(f"❌ Replay archive not found: {archive}")
+            exit(1)
+        recorder, replayer = None, Replayer(archive, latency_scale)
+        atexit.register(replayer.close)
+        from google_services import use_replay_token_cache
+        use_replay_token_cache()
+    else:
+        logger.error(f"❌ Unknown TRANSPORT_MODE '{mode}'. Use record, replay or off.")
+        exit(1)
+
+    _patch_requests(recorder, replayer)
+    _patch_httplib2(recorder, replayer)
+    _installed = True
@@ -0,0 +1,186 @@
+"""
+Pipelined update engine for content_replacer.py (UPDATE_ENGINE=async).
+
+Each city still goes lookup -> update -> sheet write, as in UpdatePageSink.publish, but the stages run
+concurrently across cities: every stage has its own workers and a bounded queue in front of it, so a slow
+stage holds back the one before it instead of piling rendered pages up in memory. Blocking calls run on
+threads (asyncio.to_thread); progress and counters are only touched on the event loop, once per city,
+after its sheet write.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from logging_config import logger
+
+from google_services import get_client_pool
+from write_url import write_url_to_sheet
+from pipeline import new_counters, make_renderer, commit_pages
+from resilience import RunBudget
+from memory_profile import NULL_PROFILER
+from html_optimizer import optimize_html
+
+
+def merge_counters(counters, tab_counters):
+    for key, value in tab_counters.items():
+        if isinstance(value, dict):
+            counters[key].update(value)
+        else:
+            counters[key] += value
+
+
+class UpdateEngine:
+    """Render -> lookup -> update -> sheet write for an UpdatePageSink, `workers` at a time per stage."""
+
+    def __init__(self, sink, config, progress, workers, profiler=NULL_PROFILER):
+        self.sink = sink
+        self.config = config
+        self.progress = progress
+        self.workers = workers
+        self.profiler = profiler
+        self.client_pool = get_client_pool(config["google_credentials_file"])
+        self.counters = new_counters()
+        self.budget = RunBudget(config["run_deadline_minutes"], config["max_pages_per_run"])
+        self.queued = set()     # cities already in the pipeline this run, so a repeated tab is published once
+        self.in_flight = 0
+        self.settled = None     # asyncio.Condition, created on the loop
+
+    def render_tab(self, render, tab):
+        """Render one tab on a worker thread with its own counters, merged on the loop afterwards."""
+        tab_counters = new_counters()
+        try:
+            pages = render(tab, tab_counters)
+        except Exception as e:
+            return {}, tab_counters, e
+
+        if self.config["html_optimize"]:
+            pages = {city_name: optimize_html(html_content) for city_name, html_content in pages.items()}
+        return pages, tab_counters, None
+
+    def lookup_page(self, target):
+        target["page_id"], target["expected_modified"] = self.sink.lookup(target)
+        return bool(target["page_id"])
+
+    def update_page(self, target):
+        return self.sink.update(target, target["page_id"], target.pop("html_content"), target["expected_modified"])
+
+    def write_sheet(self, target):
+        mark_args = self.sink.mark_args(target["city_name"])
+        if mark_args is None:
+            return True
+        # Worker threads must not share the main thread's Sheets client
+        with self.client_pool.sheets() as sheet_service:
+            if write_url_to_sheet(sheet_service, *mark_args):
+                return True
+        logger.warning(f"⚠️ Sheet write for '{target['city_name']}' failed. Leaving the city for the next run.")
+        return False
+
+    async def settle(self, target, done):
+        """Last step for every queued city: commit it when it went through all stages."""
+        if done:
+            commit_pages([target["city_name"]], self.config, self.progress, self.counters, self.budget)
+            self.profiler.checkpoint("post")
+        self.in_flight -= 1
+        async with self.settled:
+            self.settled.notify_all()
+
+    async def wait_for_budget(self):
+        """With MAX_PAGES_PER_RUN, let in-flight pages finish before deciding whether another tab fits."""
+        if not self.budget.max_pages:
+            return
+        async with self.settled:
+            await self.settled.wait_for(lambda: not self.in_flight or self.budget.pages + self.in_flight < self.budget.max_pages)
+
+    async def stage(self, name, queue, next_queue, work):
+        while True:
+            target = await queue.get()
+            try:
+                if not await asyncio.to_thread(work, target):
+                    self.counters["skipped_count"] += 1
+                    await self.settle(target, False)
+                elif next_queue is not None:
+                    await next_queue.put(target)
+                else:
+                    await self.settle(target, True)
+            except Exception as e:
+                logger.error(f"⚠️ Error in {name} stage for city '{target['city_name']}': {e}", exc_info=e)
+                await self.settle(target, False)
+            finally:
+                queue.task_done()
+
+    async def produce(self, tabs, render, lookup_queue, stop_event):
+        for tab in tabs:
+            if stop_event is not None and stop_event.is_set():
+                logger.warning("🛑 Stop requested. Leaving remaining tabs for the next run.")
+                break
+
+            await self.wait_for_budget()
+            stop_reason = self.budget.exhausted()
+            if stop_reason:
+                logger.warning(f"⏱️ {stop_reason.capitalize()} after {self.budget.pages} pages. Leaving remaining tabs for the next run.")
+                break
+
+            pages, tab_counters, error = await asyncio.to_thread(self.render_tab, render, tab)
+            merge_counters(self.counters, tab_counters)
+            self.profiler.checkpoint("tab_render")
+
+            if isinstance(error, ValueError):
+                logger.warning(f"🚫 Skipping tab due to invalid internal link: {error}")
+                self.counters["wrong_internal_link_content_count"] += 1
+                self.counters["unpublishable"][tab["tabProperties"]["title"].strip()] = "invalid internal link"
+                continue
+            if error is not None:
+                logger.error(f"⚠️ Error processing tab: {error}", exc_info=error)
+                continue
+
+            for city_name, html_content in pages.items():
+                if city_name in self.queued:
+                    logger.info(f"⏩ Skipping '{city_name}': already published in this run.")
+                    continue
+
+                target = self.sink.prepare(city_name, self.counters)
+                if target is None:
+                    continue
+
+                target["html_content"] = html_content
+                self.queued.add(city_name)
+                self.in_flight += 1
+                await lookup_queue.put(target)      # blocks while the lookup stage is backed up
+
+    async def run(self, tabs, render, stop_event=None):
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=3 * self.workers + 1, thread_name_prefix="update")
+        )
+        self.settled = asyncio.Condition()
+        lookup_queue, update_queue, sheet_queue = (asyncio.Queue(maxsize=self.workers) for _ in range(3))
+
+        tasks = []
+        for _ in range(self.workers):
+            tasks.append(asyncio.create_task(self.stage("lookup", lookup_queue, update_queue, self.lookup_page)))
+            tasks.append(asyncio.create_task(self.stage("update", update_queue, sheet_queue, self.update_page)))
+            tasks.append(asyncio.create_task(self.stage("sheet write", sheet_queue, None, self.write_sheet)))
+
+        try:
+            await self.produce(tabs, render, lookup_queue, stop_event)
+            for queue in (lookup_queue, update_queue, sheet_queue):
+                await queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run_update_engine(tabs, config, cities, progress, sink, stop_event=None, profiler=NULL_PROFILER, render=None):
+    """Pipelined counterpart of pipeline.run_pipeline for an UpdatePageSink. Returns (counters, total_tabs)."""
+    total_tabs = len(tabs)
+    logger.info(f"📄 Document contains {total_tabs} tabs.")
+    logger.info(f"🔀 Async update engine: {config['update_stage_workers']} workers per stage (lookup, update, sheet write).")
+
+    if render is None:
+        render = make_renderer(tabs, config, cities, progress)
+
+    engine = UpdateEngine(sink, config, progress, config["update_stage_workers"], profiler)
+    asyncio.run(engine.run(tabs, render, stop_event))
+
+    commit_pages(sink.flush(engine.counters), config, progress, engine.counters, engine.budget)
+    profiler.checkpoint("post")
+
+    return engine.counters, total_tabs
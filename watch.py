@@ -0,0 +1,154 @@
+import json
+import signal
+import hashlib
+import threading
+from logging_config import logger
+
+from pipeline import process_document_tabs, load_cities, log_summary, save_progress
+
+
+def tab_fingerprint(tab):
+    """Hash a tab's title, body and child tabs so edits can be detected between polls."""
+    payload = json.dumps(
+        [tab.get("tabProperties", {}).get("title"), tab.get("documentTab", {}).get("body"), tab.get("childTabs")],
+        sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def select_tabs(tabs, fingerprints, progress, doc_id, resolved, blocked):
+    """
+    Pick the tabs that still need publishing. Returns (selected, changed, edited).
+    Tabs that failed in a way only an edit can fix (blocked: title -> fingerprint) are left out until they change.
+    changed tells whether any tab differs from the last poll; edited lists published tabs that changed since,
+    which watch mode does not republish.
+    """
+    selected, edited = [], []
+    changed = False
+    for tab in tabs:
+        tab_id = tab["tabProperties"].get("tabId")
+        fingerprint = tab_fingerprint(tab)
+        title = tab["tabProperties"]["title"].strip()
+        previous = fingerprints.get(tab_id)
+        fingerprints[tab_id] = fingerprint
+
+        if previous != fingerprint:
+            changed = True
+        if resolved.get(title, title) in progress[doc_id]:
+            if previous is not None and previous != fingerprint:
+                edited.append(title)
+        elif blocked.get(title) != fingerprint:
+            selected.append(tab)
+
+    return selected, changed, edited
+
+
+def unpublished_tabs(tabs, cities, progress, doc_id, counters):
+    """Tabs of sheet cities that are still not in progress after a pass, e.g. because WordPress was down."""
+    city_set = {city.strip() for city in cities}
+    unpublished = []
+    for tab in tabs:
+        title = tab["tabProperties"]["title"].strip()
+        city_name = counters["auto_matched"].get(title, title)
+        if city_name in city_set and city_name not in progress[doc_id] and city_name not in counters["unpublishable"]:
+            unpublished.append(title)
+    return unpublished
+
+
+def run_watch(config, doc_service, sheet_service, progress, interval, doc=None):
+    """
+    Poll the document and publish tabs that are not yet published until stopped.
+    doc is the document already loaded at startup, used for the first pass instead of fetching it again.
+    A revision only counts as handled once all its tabs are published; until then every poll retries them.
+    Without a revisionId (read-only access) the whole document is fetched on every poll and the tab
+    fingerprints decide whether anything changed. SIGHUP always forces a pass.
+    """
+    stop_event = threading.Event()
+    poll_now = threading.Event()
+    force_pass = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.warning(f"🛑 Received signal {signum}. Finishing current page and shutting down...")
+        stop_event.set()
+        poll_now.set()
+
+    def request_poll(signum, frame):
+        logger.info("🔔 Pass requested by signal.")
+        force_pass.set()
+        poll_now.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, request_poll)   # local change signal: `kill -HUP <pid>`
+
+    doc_id = config["doc_id"]
+    last_revision = None
+    fingerprints = {}
+    resolved = {}       # tab title -> sheet city, from the city matcher
+    blocked = {}        # tab title -> fingerprint of a tab that can't publish until it is edited
+    warned = False
+    force_pass.set()    # the first pass always runs
+
+    logger.info(f"👀 Watching document {doc_id} every {interval}s.")
+
+    try:
+        while not stop_event.is_set():
+            try:
+                force = force_pass.is_set()
+                force_pass.clear()
+                if force:
+                    blocked.clear()
+
+                if doc is None:
+                    revision = doc_service.documents().get(documentId=doc_id, fields="revisionId").execute().get("revisionId")
+                else:
+                    revision = doc.get("revisionId")
+                if revision is None and not warned:
+                    logger.warning("⚠️ Docs API returned no revisionId (read-only access). Comparing tab contents on every poll instead.")
+                    warned = True
+
+                if revision is None or revision != last_revision or force:
+                    if revision is not None and revision != last_revision:
+                        logger.info(f"🔄 Document revision changed: {last_revision} -> {revision}")
+                    if doc is None:
+                        doc = doc_service.documents().get(documentId=doc_id, includeTabsContent=True).execute()
+                    tabs, changed, edited = select_tabs(doc.get("tabs", []), fingerprints, progress, doc_id, resolved, blocked)
+                    unpublished = []
+
+                    if edited:
+                        logger.warning(f"✏️ {len(edited)} published tabs changed ({', '.join(edited[:10])}). Watch mode only publishes new tabs; run content_replacer.py to update their pages.")
+
+                    if tabs:
+                        cities = load_cities(sheet_service, config["spreadsheet_id"], config["sheet_name"])
+                        counters, total_tabs = process_document_tabs(
+                            {"tabs": tabs}, config, sheet_service, cities, progress, stop_event=stop_event
+                        )
+                        log_summary(counters, total_tabs, doc_id)
+                        resolved.update(counters["auto_matched"])
+                        unpublished = unpublished_tabs(tabs, cities, progress, doc_id, counters)
+
+                        # Wrong city names, empty tabs and invalid links wait for an edit (or SIGHUP) instead of every poll
+                        for tab in tabs:
+                            title = tab["tabProperties"]["title"].strip()
+                            if title not in unpublished and resolved.get(title, title) not in progress[doc_id]:
+                                blocked[title] = fingerprints[tab["tabProperties"].get("tabId")]
+                    elif changed or force:
+                        logger.info("ℹ️ No new tabs to publish.")
+
+                    if unpublished:
+                        logger.warning(f"🔁 {len(unpublished)} tabs are still unpublished ({', '.join(unpublished[:10])}). Retrying on the next poll.")
+                    else:
+                        last_revision = revision
+
+            except Exception as e:
+                # Transient API errors must not kill the daemon; retry on the next poll
+                logger.exception(f"⚠️ Watch poll failed: {e!r}")
+
+            doc = None      # only the first pass reuses the startup copy
+            poll_now.wait(interval)
+            poll_now.clear()
+
+    finally:
+        save_progress(config["progress_file"], progress)
+        logger.info("👋 Watch stopped. Progress flushed.")
@@ -1,3 +1,9 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from resilience import sheets_breaker
+
 
 def write_url_to_sheet(sheet_service, spreadsheetId, sheet_name, column, page_url, city_name, cities, logger):
     """Writes the generated WordPress page URL back to the specified Google Sheet."""
@@ -15,13 +21,28 @@ def write_url_to_sheet(sheet_service, spreadsheetId, sheet_name, column, page_ur
                 break
 
         if row_index:
+            if not sheets_breaker.allow():
+                logger.warning(f"⚡ Google Sheets circuit open. Not writing '{page_url}' for '{city_name}'.")
+                return False
+
             # Update column B in the correct row
-            sheet_service.spreadsheets().values().update(
-                spreadsheetId=spreadsheetId,
-                range=f"{sheet_name}!{column}{row_index}",
-                valueInputOption="RAW",
-                body={"values": [[page_url]]}
-            ).execute()
+            try:
+                sheet_service.spreadsheets().values().update(
+                    spreadsheetId=spreadsheetId,
+                    range=f"{sheet_name}!{column}{row_index}",
+                    valueInputOption="RAW",
+                    body={"values": [[page_url]]}
+                ).execute()
+            except Exception as e:
+                status = getattr(getattr(e, "resp", None), "status", None)     # HttpError carries the response
+                if status is not None:
+                    sheets_breaker.record_status(int(status))
+                else:
+                    sheets_breaker.record_failure()
+                raise
+            finally:
+                sheets_breaker.release()
+            sheets_breaker.record_success()
             logger.info(f"✅ Link updated in the sheet successfully in {sheet_name}!{column}{row_index}") 
             return True
         else:
@@ -31,6 +52,89 @@ def write_url_to_sheet(sheet_service, spreadsheetId, sheet_name, column, page_ur
     except Exception as e:
         logger.error(f"❌ Error while writing URL for '{city_name}': {e}")
         return False
+
+
+class SheetWriteQueue:
+    """
+    Run write_url_to_sheet calls on worker threads so sheet writes overlap with WordPress posting.
+    Each worker uses its own Sheets client from the GoogleClientPool; flush() waits for all pending writes.
+    """
+
+    def __init__(self, client_pool, workers):
+        self.client_pool = client_pool
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sheet-writer")
+        self.futures = []
+
+    def _write(self, args):
+        with self.client_pool.sheets() as sheet_service:
+            return write_url_to_sheet(sheet_service, *args)
+
+    def submit(self, spreadsheetId, sheet_name, column, page_url, city_name, cities, logger):
+        """Queue a write; the returned future resolves to write_url_to_sheet's result."""
+        future = self.executor.submit(self._write, (spreadsheetId, sheet_name, column, page_url, city_name, cities, logger))
+        self.futures.append((future, city_name, logger))
+        return future
+
+    def flush(self):
+        """Wait for every queued write, log a summary of the failed ones and return their city names."""
+        futures, self.futures = self.futures, []
+        failed = [city_name for future, city_name, _ in futures if not future.result()]
+        if failed:
+            futures[0][2].warning(f"⚠️ {len(failed)} of {len(futures)} queued sheet writes failed: {', '.join(failed[:10])}{' ...' if len(failed) > 10 else ''}")
+        return failed
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown(wait=True)
+
+
+class PendingSheetWrites:
+    """
+    Sheet writes that failed after their page was already created, kept in a JSON file so the next run
+    retries them instead of losing the link (the city itself is done and will not be created again).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.writes = []
+        self.lock = threading.Lock()
+
+        try:
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    self.writes = json.load(f)
+        except Exception:
+            self.writes = []
+
+    def add(self, spreadsheetId, sheet_name, column, page_url, city_name):
+        with self.lock:
+            self.writes.append({"spreadsheet_id": spreadsheetId, "sheet_name": sheet_name, "column": column, "value": page_url, "city_name": city_name})
+            self._save()
+
+    def retry(self, sheet_service, spreadsheetId, sheet_name, cities, logger):
+        """Retry the kept writes for this sheet; returns how many succeeded."""
+        with self.lock:
+            ours = [w for w in self.writes if w["spreadsheet_id"] == spreadsheetId and w["sheet_name"] == sheet_name]
+            if not ours:
+                return 0
+
+            logger.info(f"🔁 Retrying {len(ours)} sheet writes kept from an earlier run.")
+            failed = [
+                w for w in ours
+                if not write_url_to_sheet(sheet_service, spreadsheetId, sheet_name, w["column"], w["value"], w["city_name"], cities, logger)
+            ]
+            self.writes = [w for w in self.writes if w not in ours] + failed
+            self._save()
+
+        if failed:
+            logger.warning(f"⚠️ {len(failed)} kept sheet writes failed again ({', '.join(w['city_name'] for w in failed)}). They stay in {self.path}.")
+        return len(ours) - len(failed)
+
+    def _save(self):
+        if not self.writes and not os.path.exists(self.path):
+            return
+        with open(self.path, "w") as f:
+            json.dump(self.writes, f, indent=4)
 '''
 # def write_url_to_sheet1(sheet_service, spreadsheetId, sheet_name, column, page_url, city_name, cities, logger):
 
@@ -0,0 +1,247 @@
+import re
+import html
+import json
+import unicodedata
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from urllib.parse import urlparse
+from xml.sax.saxutils import escape
+
+import requests
+from requests.auth import HTTPBasicAuth
+from logging_config import logger
+
+from post import build_page_data
+from sinks import format_page_meta
+from pipeline import save_progress, get_page_registry
+from write_url import write_url_to_sheet
+
+WXR_HEADER = '''<?xml version="1.0" encoding="UTF-8" ?>
+<rss version="2.0"
+    xmlns:excerpt="http://wordpress.org/export/1.2/excerpt/"
+    xmlns:content="http://purl.org/rss/1.0/modules/content/"
+    xmlns:wfw="http://wellformedweb.org/CommentAPI/"
+    xmlns:dc="http://purl.org/dc/elements/1.1/"
+    xmlns:wp="http://wordpress.org/export/1.2/">
+<channel>
+    <title>{title}</title>
+    <link>{site_url}</link>
+    <language>en</language>
+    <wp:wxr_version>1.2</wp:wxr_version>
+    <wp:base_site_url>{site_url}</wp:base_site_url>
+    <wp:base_blog_url>{site_url}</wp:base_blog_url>
+    <wp:author><wp:author_login>{author}</wp:author_login></wp:author>
+'''
+
+PAGE_FIELDS = "id,slug,link,modified_gmt"     # what the page registry records
+
+WXR_FOOTER = '''</channel>
+</rss>
+'''
+
+
+def cdata(text):
+    """Wrap text in CDATA, splitting any ']]>' so the section cannot end early."""
+    return "<![CDATA[" + str(text).replace("]]>", "]]]]><![CDATA[>") + "]]>"
+
+
+def slugify(title):
+    """Approximate WordPress sanitize_title() so exported slugs match what the site will use."""
+    slug = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", slug.lower()).strip("-")
+
+
+def site_url(wp_url):
+    """https://example.com/wp-json/wp/v2/pages -> https://example.com"""
+    parsed = urlparse(wp_url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+class WxrSink:
+    """Stream every rendered city page into a WXR file for a single WordPress import (app.py --export-wxr)."""
+
+    def __init__(self, config, path):
+        self.config = config
+        self.path = path
+        # post_date is site-local time; without WP_TIMEZONE both dates are UTC, which the importer accepts as-is
+        self.timezone = timezone.utc
+        if config.get("wp_timezone"):
+            try:
+                self.timezone = ZoneInfo(config["wp_timezone"])
+            except Exception as e:
+                logger.error(f"❌ Unknown WP_TIMEZONE '{config['wp_timezone']}': {e}")
+                exit(1)
+        self.manifest = {}      # city -> slug, used to match imported links back into the sheet
+        self.file = open(path, "w", encoding="utf-8")
+        self.file.write(WXR_HEADER.format(
+            title=escape(f"{config['brand_name']} {config['category_name']} {config['country_name']}"),
+            site_url=escape(site_url(config["wp_url"])),
+            author=escape(config["wp_username"])
+        ))
+
+    def publish(self, city_name, html_content, counters):
+        config = self.config
+        page_title, key_phrase, description = format_page_meta(config, city_name)
+        page = build_page_data(
+            html_content, config["featured_img_url"], page_title, config["brand_name"],
+            key_phrase, description, config["social_image"]
+        )
+
+        slug = slugify(page_title)
+        now = datetime.now(timezone.utc)
+
+        postmeta = "".join(
+            f"        <wp:postmeta><wp:meta_key>{escape(key)}</wp:meta_key><wp:meta_value>{cdata(value)}</wp:meta_value></wp:postmeta>\n"
+            for key, value in page["meta"].items()
+        )
+
+        self.file.write(
+            "    <item>\n"
+            f"        <title>{escape(page_title)}</title>\n"
+            f"        <dc:creator>{cdata(config['wp_username'])}</dc:creator>\n"
+            f"        <content:encoded>{cdata(page['content'])}</content:encoded>\n"
+            "        <excerpt:encoded><![CDATA[]]></excerpt:encoded>\n"
+            # No wp:post_id: the importer would reuse it as the new page's ID
+            f"        <wp:post_date>{now.astimezone(self.timezone).strftime('%Y-%m-%d %H:%M:%S')}</wp:post_date>\n"
+            f"        <wp:post_date_gmt>{now.strftime('%Y-%m-%d %H:%M:%S')}</wp:post_date_gmt>\n"
+            "        <wp:comment_status>closed</wp:comment_status>\n"
+            "        <wp:ping_status>closed</wp:ping_status>\n"
+            f"        <wp:post_name>{escape(slug)}</wp:post_name>\n"
+            f"        <wp:status>{page['status']}</wp:status>\n"
+            "        <wp:post_parent>0</wp:post_parent>\n"
+            "        <wp:menu_order>0</wp:menu_order>\n"
+            "        <wp:post_type>page</wp:post_type>\n"
+            f"{postmeta}"
+            "    </item>\n"
+        )
+
+        self.manifest[city_name] = slug
+        logger.info(f"📦 Exported '{city_name}' to WXR as '{slug}'")
+
+        # Not published yet: progress is only recorded once the import is matched back (--match-wxr)
+        return []
+
+    def flush(self, counters):
+        return []
+
+    def close(self):
+        self.file.write(WXR_FOOTER)
+        self.file.close()
+
+        with open(manifest_path(self.path), "w") as f:
+            json.dump({"doc_id": self.config["doc_id"], "pages": self.manifest}, f, indent=4)
+
+        logger.info(f"📦 Wrote {len(self.manifest)} pages to {self.path}. Import it with Tools → Import → WordPress, then run --match-wxr {self.path}")
+
+
+def manifest_path(wxr_path):
+    return f"{wxr_path}.manifest.json"
+
+
+def fetch_pages_by_slug(config, slugs, chunk_size=100):
+    """Look up {slug: page} for imported pages, up to 100 slugs per REST request."""
+    auth = HTTPBasicAuth(config["wp_username"], config["wp_app_password"])
+    pages = {}
+
+    for start in range(0, len(slugs), chunk_size):
+        chunk = slugs[start:start + chunk_size]
+        try:
+            res = requests.get(
+                config["wp_url"],
+                params={"slug": ",".join(chunk), "per_page": chunk_size, "_fields": PAGE_FIELDS, "status": "publish"},
+                auth=auth,
+                timeout=30
+            )
+            res.raise_for_status()
+            pages.update({page["slug"]: page for page in res.json()})
+        except Exception as e:
+            logger.error(f"❌ Failed to look up {len(chunk)} imported slugs: {e}")
+
+    return pages
+
+
+def fetch_page_by_title(config, page_title, slug):
+    """
+    Fallback for pages the slug lookup missed, e.g. when WordPress added a "-2" suffix on a collision or
+    sanitize_title() differs from slugify(): search by title and prefer the slug with the expected stem.
+    """
+    try:
+        res = requests.get(
+            config["wp_url"],
+            params={"search": page_title, "per_page": 20, "_fields": f"{PAGE_FIELDS},title", "status": "publish", "orderby": "date", "order": "desc"},
+            auth=HTTPBasicAuth(config["wp_username"], config["wp_app_password"]),
+            timeout=30
+        )
+        res.raise_for_status()
+        pages = [page for page in res.json() if html.unescape(page["title"]["rendered"]).strip() == page_title]
+    except Exception as e:
+        logger.error(f"❌ Failed to look up imported page '{page_title}' by title: {e}")
+        return None
+
+    if not pages:
+        return None
+    stem_matches = [page for page in pages if page["slug"] == slug or page["slug"].startswith(f"{slug}-")]
+    return (stem_matches or pages)[0]
+
+
+def write_links(config, sheet_service, cities, data, links):
+    """Write the links in one batchUpdate; if that fails, fall back to one write per city. Returns the cities written."""
+    try:
+        sheet_service.spreadsheets().values().batchUpdate(
+            spreadsheetId=config["spreadsheet_id"],
+            body={"valueInputOption": "RAW", "data": data}
+        ).execute()
+        return list(links)
+    except Exception as e:
+        logger.error(f"❌ Batch write of {len(data)} imported links failed: {e}. Writing them one by one.")
+
+    return [
+        city_name for city_name, link in links.items()
+        if write_url_to_sheet(sheet_service, config["spreadsheet_id"], config["sheet_name"], config["url_column"], link, city_name, cities, logger)
+    ]
+
+
+def match_imported_links(config, sheet_service, cities, progress, wxr_path):
+    """
+    After the WXR import, write every imported page link into the sheet in one batch and record progress.
+    Imported pages also go into the page registry, so later updates need no slug lookup.
+    """
+    with open(manifest_path(wxr_path), "r") as f:
+        manifest = json.load(f)["pages"]
+
+    pages = fetch_pages_by_slug(config, list(manifest.values()))
+    registry = get_page_registry(config)
+
+    rows = {}
+    for i, row in enumerate(cities, start=2):    # 1st row is title so, starting from 2nd row
+        rows.setdefault(row.strip(), i)
+
+    data = []
+    matched = {}
+    for city_name, slug in manifest.items():
+        if city_name not in rows:
+            logger.warning(f"⚠️ City '{city_name}' not found in sheet!")
+            continue
+        page = pages.get(slug)
+        if not page:
+            page_title = format_page_meta(config, city_name)[0]
+            page = fetch_page_by_title(config, page_title, slug)
+            if not page:
+                logger.warning(f"⚠️ Imported page for '{city_name}' not found by slug '{slug}' or title '{page_title}'.")
+                continue
+            logger.info(f"🔗 Matched '{city_name}' by title: {page['link']}")
+        data.append({"range": f"{config['sheet_name']}!{config['url_column']}{rows[city_name]}", "values": [[page["link"]]]})
+        matched[city_name] = page["link"]
+        if registry is not None:
+            registry.record(city_name, page)
+
+    written = write_links(config, sheet_service, cities, data, matched) if data else []
+
+    for city_name in written:
+        if city_name not in progress[config["doc_id"]]:
+            progress[config["doc_id"]].append(city_name)
+    save_progress(config["progress_file"], progress)
+    if registry is not None:
+        registry.save()
+
+    logger.info(f"✅ Matched {len(matched)} of {len(manifest)} imported pages and wrote {len(written)} links to the sheet.")
@@ -1,14 +1,14 @@
 <?php
 /**
  * Plugin Name: Expose Yoast SEO Meta in REST
- * Description: Exposes Yoast SEO fields in REST API so they can be updated programmatically.
- * Version: 1.0
+ * Description: Exposes Yoast SEO fields in REST API so they can be updated programmatically, plus a slug-addressed bulk upsert route, revision control and modified-time conflict checks for programmatic updates.
+ * Version: 1.3.2
  * Author: Bala
  */
 
 
-function expose_yoast_meta_in_rest() {
-    $yoast_fields = [
+function loclite_yoast_meta_fields() {
+    return [
         '_yoast_wpseo_focuskw',
         '_yoast_wpseo_title',
         '_yoast_wpseo_metadesc',
@@ -19,6 +19,11 @@ function expose_yoast_meta_in_rest() {
         '_yoast_wpseo_twitter-description',
         '_yoast_wpseo_twitter-image',
     ];
+}
+
+
+function expose_yoast_meta_in_rest() {
+    $yoast_fields = loclite_yoast_meta_fields();
 
     foreach ($yoast_fields as $field) {
         register_post_meta('page', $field, [
@@ -29,3 +34,207 @@ function expose_yoast_meta_in_rest() {
     }
 }
 add_action('init', 'expose_yoast_meta_in_rest');
+
+
+/**
+ * Skip or cap post revisions for the rest of the current request.
+ *
+ * $mode is "skip" (no revision is stored) or a number N (a revision is stored and only the newest N are kept).
+ * Returns false for anything else so callers can reject the request.
+ */
+function loclite_limit_revisions($mode) {
+    if ($mode === 'skip') {
+        $keep = 0;
+    } elseif (is_numeric($mode) && (int) $mode >= 0) {
+        $keep = (int) $mode;
+    } else {
+        return false;
+    }
+
+    // wp_save_post_revision() stores nothing when this is 0 and trims older revisions down to N otherwise
+    add_filter('wp_revisions_to_keep', function () use ($keep) {
+        return $keep;
+    }, PHP_INT_MAX);
+
+    return true;
+}
+
+
+/**
+ * Honour an "X-Loclite-Revisions: skip|N" header on core REST requests (e.g. POST /wp/v2/pages/<id>)
+ * from users who can edit pages, so single-page updates can skip revisions too.
+ */
+function loclite_revisions_header($response, $handler, WP_REST_Request $request) {
+    $mode = $request->get_header('x_loclite_revisions');
+    if ($mode === null || $mode === '' || !current_user_can('edit_pages')) {
+        return $response;
+    }
+
+    if (!loclite_limit_revisions(strtolower(trim($mode)))) {
+        return new WP_Error('invalid_revisions', 'X-Loclite-Revisions must be "skip" or a number.', ['status' => 400]);
+    }
+
+    return $response;
+}
+add_filter('rest_request_before_callbacks', 'loclite_revisions_header', 10, 3);
+
+
+/**
+ * True when the page was modified after $expected_gmt ("Y-m-d\TH:i:s", as in the REST modified_gmt field).
+ */
+function loclite_modified_conflict($post_id, $expected_gmt) {
+    if ($expected_gmt === null || $expected_gmt === '') {
+        return false;
+    }
+    return get_post_modified_time('Y-m-d\TH:i:s', true, $post_id) !== $expected_gmt;
+}
+
+
+/**
+ * Refuse a core REST page update with "X-Loclite-If-Modified-Gmt: <modified_gmt>" when the page has been
+ * edited since, so programmatic refreshes never overwrite manual edits.
+ * This runs before permission_callback, so it only looks at /wp/v2/pages/<id> writes by users who may edit
+ * that page; everyone else gets core's normal response and never sees the page's modified time.
+ */
+function loclite_modified_header($response, $handler, WP_REST_Request $request) {
+    $expected = $request->get_header('x_loclite_if_modified_gmt');
+    if ($expected === null || $request->get_method() === 'GET' || is_wp_error($response)) {
+        return $response;
+    }
+    if (!preg_match('#^/wp/v2/pages/(\d+)$#', $request->get_route(), $matches)) {
+        return $response;
+    }
+
+    $post_id = (int) $matches[1];
+    if (get_post_type($post_id) !== 'page' || !current_user_can('edit_post', $post_id)) {
+        return $response;
+    }
+
+    if (loclite_modified_conflict($post_id, $expected)) {
+        return new WP_Error('loclite_conflict', 'Page was modified since ' . $expected . '.', [
+            'status'       => 409,
+            'modified_gmt' => get_post_modified_time('Y-m-d\TH:i:s', true, $post_id),
+        ]);
+    }
+
+    return $response;
+}
+add_filter('rest_request_before_callbacks', 'loclite_modified_header', 10, 3);
+
+
+/**
+ * Bulk upsert pages addressed by slug.
+ *
+ * POST /wp-json/loclite/v1/pages/bulk-upsert
+ * Body: {"items": [{"slug": "...", "content": "...", "meta": {...}, "title": "...", "status": "...", "create": true}]}
+ * Returns one {slug, id, link, modified_gmt, status} entry per item, in request order.
+ * Items with "create": false are only updated; unknown slugs come back as "not_found".
+ * Items with a known "id" skip the slug lookup; with "modified" (modified_gmt) they come back as "conflict"
+ * instead of being updated when the page has been edited since.
+ * Pages the user may not edit (current_user_can('edit_post', ID), as core REST checks) come back as "forbidden".
+ * Optional top-level "revisions": "skip" or N skips or caps revisions for every item in the request.
+ */
+function loclite_bulk_upsert_pages(WP_REST_Request $request) {
+    $items = $request->get_param('items');
+    if (!is_array($items)) {
+        return new WP_Error('invalid_items', 'Request body must contain an "items" array.', ['status' => 400]);
+    }
+
+    $revisions = $request->get_param('revisions');
+    if ($revisions !== null && !loclite_limit_revisions(strtolower((string) $revisions))) {
+        return new WP_Error('invalid_revisions', '"revisions" must be "skip" or a number.', ['status' => 400]);
+    }
+
+    $allowed_meta = loclite_yoast_meta_fields();
+    $results = [];
+
+    foreach ($items as $item) {
+        $slug = isset($item['slug']) ? trim($item['slug'], '/') : '';
+        if ($slug === '') {
+            $results[] = ['slug' => $slug, 'id' => null, 'link' => null, 'status' => 'error', 'message' => 'Missing slug.'];
+            continue;
+        }
+
+        $postarr = ['post_type' => 'page'];
+        if (isset($item['content'])) {
+            $postarr['post_content'] = $item['content'];
+        }
+        if (isset($item['title'])) {
+            $postarr['post_title'] = $item['title'];
+        }
+
+        if (!empty($item['id'])) {
+            $existing = get_post((int) $item['id']);
+            if ($existing && $existing->post_type !== 'page') {
+                $existing = null;
+            }
+        } else {
+            $existing = get_page_by_path($slug, OBJECT, 'page');
+        }
+
+        if ($existing && !current_user_can('edit_post', $existing->ID)) {
+            $results[] = [
+                'slug' => $slug, 'id' => $existing->ID, 'link' => null, 'status' => 'forbidden',
+                'message' => 'Sorry, you are not allowed to edit this page.',
+            ];
+            continue;
+        }
+
+        if ($existing && isset($item['modified']) && loclite_modified_conflict($existing->ID, $item['modified'])) {
+            $results[] = [
+                'slug' => $slug, 'id' => $existing->ID, 'link' => get_permalink($existing->ID),
+                'modified_gmt' => get_post_modified_time('Y-m-d\TH:i:s', true, $existing->ID), 'status' => 'conflict',
+            ];
+            continue;
+        }
+
+        if ($existing) {
+            $postarr['ID'] = $existing->ID;
+            if (isset($item['status'])) {
+                $postarr['post_status'] = $item['status'];
+            }
+            $post_id = wp_update_post(wp_slash($postarr), true);
+            $status = 'updated';
+        } elseif (isset($item['create']) && !$item['create']) {
+            $results[] = ['slug' => $slug, 'id' => null, 'link' => null, 'status' => 'not_found'];
+            continue;
+        } else {
+            $postarr['post_name'] = basename($slug);
+            $postarr['post_status'] = isset($item['status']) ? $item['status'] : 'publish';
+            $post_id = wp_insert_post(wp_slash($postarr), true);
+            $status = 'created';
+        }
+
+        if (is_wp_error($post_id)) {
+            $results[] = ['slug' => $slug, 'id' => null, 'link' => null, 'status' => 'error', 'message' => $post_id->get_error_message()];
+            continue;
+        }
+
+        if (!empty($item['meta']) && is_array($item['meta'])) {
+            foreach ($item['meta'] as $key => $value) {
+                if (in_array($key, $allowed_meta, true)) {
+                    update_post_meta($post_id, $key, wp_slash($value));
+                }
+            }
+        }
+
+        $results[] = [
+            'slug' => $slug, 'id' => $post_id, 'link' => get_permalink($post_id),
+            'modified_gmt' => get_post_modified_time('Y-m-d\TH:i:s', true, $post_id), 'status' => $status,
+        ];
+    }
+
+    return rest_ensure_response($results);
+}
+
+
+function register_loclite_bulk_upsert_route() {
+    register_rest_route('loclite/v1', '/pages/bulk-upsert', [
+        'methods'             => 'POST',
+        'callback'            => 'loclite_bulk_upsert_pages',
+        'permission_callback' => function () {
+            return current_user_can('edit_pages') && current_user_can('publish_pages');
+        },
+    ]);
+}
+add_action('rest_api_init', 'register_loclite_bulk_upsert_route');